@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ベンチマーク: main.py の性能測定
+- export-scaling: export_to_excel() がファイル数×画像数に対して線形に処理できるかを確認する
+- thumbnail:      resize_image_for_excel() の quality / fast モードを比較する
+- docx:           大きな.docxで python-docx / zip の抽出エンジンを比較する
+- pdf-thumbnail:  PDF画像のサムネイル作成を pil / pixmap で比較する
+- suite:          合成した.docx/.pdfコーパスで各処理段階のスループットを測定し、基準値と比較する
+
+使用例:
+    python benchmark.py export-scaling --sizes 1000 10000 100000 1000000
+    python benchmark.py thumbnail --repeat 5
+    python benchmark.py docx --paragraphs 20000 --images 50
+    python benchmark.py pdf-thumbnail --pages 20 --repeat 3
+    python benchmark.py suite --docs 40 --pages 5 --images-per-page 4 --save-baseline bench_baseline.json
+    python benchmark.py suite --docs 40 --pages 5 --images-per-page 4 --baseline bench_baseline.json
+"""
+
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+from docx import Document
+from docx.shared import Inches
+import fitz
+
+import main as extractor
+from main import (
+    export_to_excel, group_images_by_file, resize_image_for_excel, extract_images_from_docx,
+    crawl_file_entries, extract_images_from_file, extract_images_from_pdf,
+    THUMBNAIL_MODES, DOCX_ENGINES, PDF_THUMBNAIL_ENGINES,
+)
+
+# ===== 合成データ生成 =====
+def make_image_records(record_count: int, images_per_file: int = 10) -> List[Dict[str, Any]]:
+    """
+    ダミーの画像レコードを生成（画像デコードを伴わないよう thumbnail=None）
+
+    Excel出力の行組み立て・索引処理のみを測定するため、実画像は含めない。
+    """
+    file_count = max(1, record_count // images_per_file)
+    file_paths = [Path(f"synthetic/doc_{i:07d}.pdf") for i in range(file_count)]
+    return [
+        {
+            'file_path': file_paths[i % file_count],
+            'page_number': 1,
+            'image_index': i // file_count,
+            'thumbnail': None,
+            'format': 'PNG',
+            'size': (100, 100),
+            'mode': 'RGB',
+        }
+        for i in range(record_count)
+    ]
+
+def make_sample_image(width: int, height: int, image_format: str, mode: str = 'RGB') -> bytes:
+    """写真に近い（グラデーション+弱いノイズ）テスト画像を生成してエンコード"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 8)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    if mode != 'RGB':
+        image = image.convert(mode)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+def make_large_docx(docx_path: Path, paragraphs: int, image_count: int) -> None:
+    """本文の段落数と画像数を指定して、ヘッダーにロゴを含む大きな.docxを生成"""
+    doc = Document()
+    logo = io.BytesIO(make_sample_image(200, 80, 'PNG'))
+    doc.sections[0].header.paragraphs[0].add_run().add_picture(logo, width=Inches(1.0))
+    
+    images_every = max(1, paragraphs // max(1, image_count))
+    added = 0
+    for i in range(paragraphs):
+        doc.add_paragraph(f"段落 {i}: " + "文書画像抽出システムのベンチマーク用テキスト。" * 5)
+        if added < image_count and i % images_every == 0:
+            picture = io.BytesIO(make_sample_image(400 + added, 300, 'JPEG'))
+            doc.add_picture(picture, width=Inches(2.0))
+            added += 1
+    doc.save(docx_path)
+
+def make_corpus_image(width: int, height: int, image_format: str, variant: int) -> bytes:
+    """variant ごとに内容の異なる画像を決定的に生成（同じ引数なら同じバイト列）"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    image = Image.merge('RGB', (gradient, gradient.rotate(90 * (variant % 4)).resize((width, height)),
+                                gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(variant)
+    for _ in range(8):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.rectangle((x, y, x + width // 6, y + height // 6),
+                       fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+def make_corpus(corpus_dir: Path, docs: int, pages: int, images_per_page: int,
+                image_sizes: List[int], formats: List[str], duplicate_ratio: float, seed: int) -> Dict[str, Any]:
+    """
+    .docx と .pdf を交互に生成して合成コーパスを作成
+
+    各画像は image_sizes（長辺のpx）と formats から乱数で選ぶ。duplicate_ratio の割合で
+    生成済みの画像を再利用し、文書内・文書間の重複画像を再現する。seed が同じなら同じコーパスになる。
+    .docx には「ページ」の区切りとして改ページを入れる。
+
+    Returns:
+        Dict: コーパスの構成（基準値との比較時に条件が一致しているかの確認に使う）
+    """
+    rng = random.Random(seed)
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    generated: List[bytes] = []
+
+    def next_image() -> bytes:
+        if generated and rng.random() < duplicate_ratio:
+            return rng.choice(generated)
+        long_side = rng.choice(image_sizes)
+        image_bytes = make_corpus_image(long_side, long_side * 3 // 4, rng.choice(formats), len(generated))
+        generated.append(image_bytes)
+        return image_bytes
+
+    for doc_index in range(docs):
+        if doc_index % 2 == 0:
+            doc = Document()
+            for page in range(pages):
+                doc.add_paragraph(f"文書 {doc_index} / ページ {page + 1}")
+                for _ in range(images_per_page):
+                    doc.add_picture(io.BytesIO(next_image()), width=Inches(1.5))
+                if page < pages - 1:
+                    doc.add_page_break()
+            doc.save(corpus_dir / f"doc_{doc_index:05d}.docx")
+        else:
+            pdf = fitz.open()
+            for page in range(pages):
+                pdf_page = pdf.new_page()
+                pdf_page.insert_text((72, 60), f"Document {doc_index} / Page {page + 1}")
+                for slot in range(images_per_page):
+                    top = 80 + slot * 170
+                    pdf_page.insert_image(fitz.Rect(72, top, 272, top + 150), stream=next_image())
+            pdf.save(corpus_dir / f"doc_{doc_index:05d}.pdf")
+            pdf.close()
+
+    return {
+        'docs': docs, 'pages': pages, 'images_per_page': images_per_page,
+        'image_sizes': image_sizes, 'formats': formats,
+        'duplicate_ratio': duplicate_ratio, 'seed': seed,
+    }
+
+# ===== Excel出力のスケーリング測定 =====
+def bench_export_scaling(sizes: List[int], images_per_file: int) -> None:
+    """レコード数を変えて export_to_excel() の処理時間を測定し、1件あたりの時間を比較"""
+    print("=== export_to_excel() スケーリング測定 ===")
+    print(f"{'レコード数':>12} {'ファイル数':>10} {'索引(秒)':>10} {'出力(秒)':>10} {'μs/件':>10} {'対最小比':>10}")
+    print("-" * 70)
+
+    baseline_per_record = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            records = make_image_records(size, images_per_file)
+            file_list = sorted({record['file_path'] for record in records})
+
+            start = time.perf_counter()
+            images_by_file = group_images_by_file(records)
+            index_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            export_to_excel(file_list, images_by_file, Path(tmp_dir) / f"bench_{size}.xlsx")
+            export_time = time.perf_counter() - start
+
+            per_record = (index_time + export_time) / size * 1e6
+            if baseline_per_record is None:
+                baseline_per_record = per_record
+            print(f"{size:>12,} {len(file_list):>10,} {index_time:>10.3f} {export_time:>10.3f} "
+                  f"{per_record:>10.2f} {per_record / baseline_per_record:>10.2f}")
+
+    print()
+    print("※ 対最小比が概ね一定であれば線形スケーリング")
+
+# ===== サムネイル作成の測定 =====
+def bench_thumbnail(repeat: int) -> None:
+    """画像サイズ・形式ごとに resize_image_for_excel() のモード別処理時間を測定"""
+    samples = [
+        ('JPEG 24MP', 6000, 4000, 'JPEG', 'RGB'),
+        ('JPEG L 24MP', 6000, 4000, 'JPEG', 'L'),
+        ('JPEG CMYK 8MP', 3264, 2448, 'JPEG', 'CMYK'),
+        ('JPEG 2MP', 1600, 1200, 'JPEG', 'RGB'),
+        ('PNG 6MP', 3000, 2000, 'PNG', 'RGB'),
+        ('PNG 0.3MP', 640, 480, 'PNG', 'RGB'),
+    ]
+    print("=== resize_image_for_excel() モード別測定 ===")
+    print(f"{'画像':<14} " + " ".join(f"{mode + '(ms)':>14}" for mode in THUMBNAIL_MODES) + f" {'速度比':>8}")
+    print("-" * 55)
+
+    for label, width, height, image_format, mode in samples:
+        image_bytes = make_sample_image(width, height, image_format, mode)
+        timings = {}
+        for mode in THUMBNAIL_MODES:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                # 同一画像のメモ化を無効にして毎回デコードさせる
+                extractor._THUMBNAIL_MEMO.clear()
+                resize_image_for_excel(image_bytes, mode=mode)
+            timings[mode] = (time.perf_counter() - start) / repeat * 1000
+        print(f"{label:<14} " + " ".join(f"{timings[mode]:>14.1f}" for mode in THUMBNAIL_MODES)
+              + f" {timings['quality'] / timings['fast']:>7.1f}x")
+
+# ===== .docx抽出エンジンの比較 =====
+def bench_docx(paragraphs: int, image_count: int, repeat: int) -> None:
+    """大きな.docxを生成し、抽出エンジンごとの処理時間と抽出数を測定"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        docx_path = Path(tmp_dir) / "large_report.docx"
+        make_large_docx(docx_path, paragraphs, image_count)
+        size_mb = docx_path.stat().st_size / (1024 * 1024)
+        
+        print("=== .docx抽出エンジン比較 ===")
+        print(f"段落数: {paragraphs:,} / 本文画像数: {image_count} + ヘッダー画像1 / ファイルサイズ: {size_mb:.1f} MB")
+        print(f"{'エンジン':<12} {'時間(ms)':>10} {'抽出数':>8}")
+        print("-" * 35)
+        for engine in DOCX_ENGINES:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    images = extract_images_from_docx(docx_path, engine=engine)
+            elapsed = (time.perf_counter() - start) / repeat * 1000
+            print(f"{engine:<12} {elapsed:>10.1f} {len(images):>8}")
+
+# ===== PDF画像のサムネイル作成方法の比較 =====
+def make_mixed_pdf(pdf_path: Path, pages: int) -> None:
+    """RGB/CMYKのJPEG・透過PNG・JPEG 2000 を各ページに配置したPDFを生成"""
+    pdf = fitz.open()
+    for page_num in range(pages):
+        base = Image.open(io.BytesIO(make_corpus_image(2400, 1800, 'PNG', page_num)))
+        variants = [('JPEG', base), ('JPEG', base.convert('CMYK'))]
+        transparent = base.convert('RGBA')
+        transparent.putalpha(Image.linear_gradient('L').resize(base.size))
+        variants.append(('PNG', transparent))
+        variants.append(('JPEG2000', base))
+        pdf_page = pdf.new_page()
+        for slot, (image_format, image) in enumerate(variants):
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format)
+            top = 40 + slot * 190
+            pdf_page.insert_image(fitz.Rect(72, top, 312, top + 180), stream=buffer.getvalue())
+    pdf.save(pdf_path)
+    pdf.close()
+
+def bench_pdf_thumbnail(pages: int, repeat: int) -> None:
+    """PDFからの抽出+サムネイル作成（stream=True）の処理時間と作成できた枚数を方式ごとに測定"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = Path(tmp_dir) / "mixed.pdf"
+        make_mixed_pdf(pdf_path, pages)
+        print("=== PDF画像のサムネイル作成方法の比較 ===")
+        print(f"ページ数: {pages} / 1ページあたり RGB JPEG・CMYK JPEG・透過PNG・JPEG 2000 (2400x1800)")
+        print(f"{'方式':<10} {'時間(ms)':>10} {'ms/画像':>10} {'作成数':>8} {'画像数':>8}")
+        print("-" * 50)
+        for engine in PDF_THUMBNAIL_ENGINES:
+            best = None
+            for _ in range(repeat):
+                extractor._THUMBNAIL_MEMO.clear()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    images = extract_images_from_pdf(pdf_path, stream=True, thumbnail_engine=engine)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            created = sum(1 for image in images if image.get('thumbnail'))
+            print(f"{engine:<10} {best * 1000:>10.1f} {best * 1000 / max(1, len(images)):>10.1f} "
+                  f"{created:>8} {len(images):>8}")
+
+# ===== 処理段階別のスループット測定 =====
+SUITE_STAGES = ('crawl', 'docx', 'pdf', 'thumbnail', 'xlsx')
+
+def _best_time(function, repeat: int):
+    """function を repeat 回実行し、最短の処理時間（秒）と最後の戻り値を返す"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def measure_stages(corpus_dir: Path, repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    コーパスに対してクロール・抽出・サムネイル作成・Excel保存を段階ごとに測定
+
+    各段階は前段の結果を入力にして単独で計測する。サムネイル作成はメモ化を
+    クリアしてから行うため、コーパス内の重複画像のみがメモ化の対象になる。
+
+    Returns:
+        Dict: 段階名 -> {'seconds', 'files', 'images', 'bytes'}
+    """
+    stages: Dict[str, Dict[str, float]] = {}
+
+    seconds, entries = _best_time(lambda: crawl_file_entries(corpus_dir), repeat)
+    stages['crawl'] = {'seconds': seconds, 'files': len(entries), 'images': 0,
+                       'bytes': sum(entry['size'] for entry in entries)}
+
+    images_by_file: Dict[Path, List[Dict[str, Any]]] = {}
+    for stage, suffix in (('docx', '.docx'), ('pdf', '.pdf')):
+        stage_entries = [entry for entry in entries if entry['path'].suffix == suffix]
+        seconds, extracted = _best_time(
+            lambda: {entry['path']: extract_images_from_file(entry['path']) for entry in stage_entries}, repeat)
+        images_by_file.update(extracted)
+        stages[stage] = {'seconds': seconds, 'files': len(stage_entries),
+                         'images': sum(len(images) for images in extracted.values()),
+                         'bytes': sum(entry['size'] for entry in stage_entries)}
+
+    all_images = [image for images in images_by_file.values() for image in images]
+
+    def make_thumbnails():
+        extractor._THUMBNAIL_MEMO.clear()
+        return [resize_image_for_excel(image['data']) for image in all_images]
+
+    seconds, thumbnails = _best_time(make_thumbnails, repeat)
+    # 縮小できなかった画像（None）は件数・バイト数に含めない
+    thumbnail_bytes = {id(image): buffer.getvalue() for image, buffer in zip(all_images, thumbnails) if buffer}
+    stages['thumbnail'] = {'seconds': seconds, 'files': len(images_by_file), 'images': len(thumbnail_bytes),
+                           'bytes': sum(len(image['data']) for image in all_images if id(image) in thumbnail_bytes)}
+
+    # Excel保存はサムネイル作成済みのレコードで測定し、リサイズの時間を含めない（縮小できなかった画像は空セル）
+    thumbnail_records = {
+        file_path: [dict({key: value for key, value in image.items() if key != 'data'},
+                         thumbnail=thumbnail_bytes.get(id(image))) for image in images]
+        for file_path, images in images_by_file.items()
+    }
+    file_list = sorted(thumbnail_records)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = Path(tmp_dir) / "suite.xlsx"
+        seconds, _ = _best_time(lambda: export_to_excel(file_list, thumbnail_records, output_path), repeat)
+        stages['xlsx'] = {'seconds': seconds, 'files': len(file_list), 'images': len(all_images),
+                          'bytes': output_path.stat().st_size}
+    return stages
+
+def _throughput(stage: Dict[str, float]) -> Dict[str, float]:
+    """段階の測定結果から files/s・images/s・MB/s を計算"""
+    seconds = max(stage['seconds'], 1e-9)
+    return {
+        'files_per_s': stage['files'] / seconds,
+        'images_per_s': stage['images'] / seconds,
+        'mb_per_s': stage['bytes'] / (1024 * 1024) / seconds,
+    }
+
+def compare_with_baseline(stages: Dict[str, Dict[str, float]], baseline: Dict[str, Any],
+                          threshold: float) -> List[str]:
+    """
+    基準値と比較し、スループットが threshold の割合を超えて低下した段階を返す
+
+    比較には files/s を使う（画像を扱う段階は images/s）。
+    """
+    regressions = []
+    for stage_name in SUITE_STAGES:
+        if stage_name not in baseline['stages']:
+            continue
+        metric = 'files_per_s' if stage_name == 'crawl' else 'images_per_s'
+        current = _throughput(stages[stage_name])[metric]
+        reference = _throughput(baseline['stages'][stage_name])[metric]
+        if reference > 0 and current < reference * (1 - threshold):
+            regressions.append(f"{stage_name}: {metric} {current:,.1f} < 基準 {reference:,.1f} "
+                               f"({(1 - current / reference) * 100:.0f}%低下)")
+    return regressions
+
+def bench_suite(corpus_options: Dict[str, Any], corpus_dir: Optional[Path], repeat: int,
+                baseline_path: Optional[Path], save_baseline: Optional[Path], threshold: float) -> int:
+    """
+    合成コーパスを生成して段階別スループットを表示し、基準値の保存・比較を行う
+
+    Returns:
+        int: 基準値から低下した段階の数（比較しない場合は0）
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = corpus_dir or Path(tmp_dir) / "corpus"
+        start = time.perf_counter()
+        corpus = make_corpus(corpus_dir, **corpus_options)
+        corpus_mb = sum(path.stat().st_size for path in corpus_dir.iterdir()) / (1024 * 1024)
+        print("=== 段階別スループット測定 ===")
+        print(f"コーパス: {corpus['docs']}文書 × {corpus['pages']}ページ × {corpus['images_per_page']}画像 / "
+              f"重複率 {corpus['duplicate_ratio']:.0%} / {corpus_mb:.1f} MB "
+              f"(生成 {time.perf_counter() - start:.1f}秒)")
+        stages = measure_stages(corpus_dir, repeat)
+
+    print(f"{'段階':<10} {'時間(秒)':>10} {'files/s':>10} {'images/s':>10} {'MB/s':>10}")
+    print("-" * 55)
+    for stage_name in SUITE_STAGES:
+        stage = stages[stage_name]
+        rates = _throughput(stage)
+        images_rate = f"{rates['images_per_s']:>10,.1f}" if stage['images'] else f"{'-':>10}"
+        print(f"{stage_name:<10} {stage['seconds']:>10.3f} {rates['files_per_s']:>10,.1f} "
+              f"{images_rate} {rates['mb_per_s']:>10,.1f}")
+
+    result = {'corpus': corpus, 'python': platform.python_version(), 'stages': stages}
+    if save_baseline is not None:
+        save_baseline.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"\n💾 基準値を保存しました: {save_baseline}")
+
+    if baseline_path is None:
+        return 0
+    baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+    if baseline['corpus'] != corpus:
+        raise ValueError(f"基準値とコーパスの条件が一致しません: {baseline_path}")
+    print(f"\n📏 基準値: {baseline_path}")
+    regressions = compare_with_baseline(stages, baseline, threshold)
+    print()
+    if regressions:
+        print(f"❌ 基準値から{threshold:.0%}を超えて低下した段階があります:")
+        for regression in regressions:
+            print(f"  - {regression}")
+    else:
+        print(f"✅ 全段階が基準値の許容範囲内です（しきい値 {threshold:.0%}）")
+    return len(regressions)
+
+# ===== メイン処理 =====
+def main(argv=None):
+    """ベンチマークの実行"""
+    parser = argparse.ArgumentParser(description="文書画像抽出システムのベンチマーク")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scaling = subparsers.add_parser('export-scaling', help="Excel出力のスケーリング測定")
+    scaling.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                         help="測定するレコード数")
+    scaling.add_argument('--images-per-file', type=int, default=10,
+                         help="1ファイルあたりの画像数")
+
+    thumbnail = subparsers.add_parser('thumbnail', help="サムネイル作成のモード別比較")
+    thumbnail.add_argument('--repeat', type=int, default=5, help="1画像あたりの繰り返し回数")
+
+    docx_bench = subparsers.add_parser('docx', help=".docx抽出エンジンの比較")
+    docx_bench.add_argument('--paragraphs', type=int, default=20000, help="本文の段落数")
+    docx_bench.add_argument('--images', type=int, default=50, help="本文の画像数")
+    docx_bench.add_argument('--repeat', type=int, default=3, help="繰り返し回数")
+
+    pdf_thumbnail = subparsers.add_parser('pdf-thumbnail', help="PDF画像のサムネイル作成方法の比較")
+    pdf_thumbnail.add_argument('--pages', type=int, default=10, help="ページ数")
+    pdf_thumbnail.add_argument('--repeat', type=int, default=3, help="繰り返し回数（最短時間を採用）")
+
+    suite = subparsers.add_parser('suite', help="合成コーパスによる段階別スループット測定")
+    suite.add_argument('--docs', type=int, default=20, help="生成する文書数（.docxと.pdfを交互に生成）")
+    suite.add_argument('--pages', type=int, default=5, help="1文書あたりのページ数")
+    suite.add_argument('--images-per-page', type=int, default=3, help="1ページあたりの画像数")
+    suite.add_argument('--image-sizes', type=int, nargs='+', default=[320, 1024, 2048],
+                       help="画像の長辺(px)の候補")
+    suite.add_argument('--formats', nargs='+', default=['JPEG', 'PNG'], help="画像形式の候補")
+    suite.add_argument('--duplicate-ratio', type=float, default=0.2,
+                       help="生成済み画像を再利用する割合（0〜1）")
+    suite.add_argument('--seed', type=int, default=0, help="コーパス生成の乱数シード")
+    suite.add_argument('--corpus-dir', type=Path, default=None,
+                       help="コーパスの生成先（未指定なら一時ディレクトリに生成して削除）")
+    suite.add_argument('--repeat', type=int, default=3, help="繰り返し回数（最短時間を採用）")
+    suite.add_argument('--baseline', type=Path, default=None, help="比較する基準値のJSON（同じマシンで --save-baseline により保存したもの）")
+    suite.add_argument('--save-baseline', type=Path, default=None, help="測定結果を基準値として保存するJSON")
+    suite.add_argument('--threshold', type=float, default=0.2,
+                       help="基準値からの低下をリグレッションとみなす割合 (既定: 0.2)")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'export-scaling':
+            bench_export_scaling(args.sizes, args.images_per_file)
+        elif args.command == 'thumbnail':
+            bench_thumbnail(args.repeat)
+        elif args.command == 'docx':
+            bench_docx(args.paragraphs, args.images, args.repeat)
+        elif args.command == 'pdf-thumbnail':
+            bench_pdf_thumbnail(args.pages, args.repeat)
+        elif args.command == 'suite':
+            corpus_options = {
+                'docs': args.docs, 'pages': args.pages, 'images_per_page': args.images_per_page,
+                'image_sizes': args.image_sizes, 'formats': args.formats,
+                'duplicate_ratio': args.duplicate_ratio, 'seed': args.seed,
+            }
+            regressions = bench_suite(corpus_options, args.corpus_dir, args.repeat,
+                                      args.baseline, args.save_baseline, args.threshold)
+            if regressions:
+                sys.exit(1)
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
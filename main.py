@@ -17,171 +17,1279 @@ targetディレクトリを再帰的にクロールし、.docxと.pdfファイ
 ※ PyMuPDF (AGPL v3) は内部使用目的のため、外部配布しない限り法的問題なし
 """
 
-from pathlib import Path
-from typing import List, Dict, Any, Optional
+from pathlib import Path, PureWindowsPath
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Tuple, Mapping, Union, Callable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque, OrderedDict
+from contextlib import contextmanager, ExitStack
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import QueueHandler, QueueListener
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape as xml_escape
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+import argparse
+import base64
+import csv
+import datetime
+import errno
+import fnmatch
+import hashlib
+import ipaddress
+import json
+import logging
+import multiprocessing
+import os
+import posixpath
+import queue
+import re
+import select
+import shutil
+import signal
+import struct
 import sys
+import tempfile
+import threading
 import io
 import time
+import urllib.request
 from PIL import Image
 from docx import Document
 import fitz  # PyMuPDF - 最高性能PDF処理ライブラリ
+try:
+    import resource  # ピーク使用メモリの取得（Windowsには存在しない）
+except ImportError:
+    resource = None
+try:
+    import numpy as np  # 行スプライト（--row-sprite）の合成に使用
+except ImportError:
+    np = None
 from openpyxl import Workbook
 from openpyxl.drawing.image import Image as ExcelImage
 from openpyxl.styles import Font, Alignment
 from openpyxl.utils import get_column_letter
 
+# ===== ログ出力機能 =====
+logger = logging.getLogger("document_image_extractor")
+
+LOG_FORMAT_ERROR_FILE = "%(asctime)s %(levelname)s [%(processName)s] %(message)s"
+
+def configure_logging(verbosity: int = 0, error_log: Optional[Path] = None) -> None:
+    """コンソール出力のレベル（-1=警告のみ、0=通常、1=詳細）とエラーログの出力先を設定"""
+    level = {-1: logging.WARNING, 0: logging.INFO}.get(verbosity, logging.DEBUG)
+    logger.handlers.clear()
+    logger.propagate = False
+    
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(level)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(console)
+    
+    if error_log is not None:
+        error_handler = logging.FileHandler(error_log, encoding='utf-8')
+        error_handler.setLevel(logging.WARNING)
+        error_handler.setFormatter(logging.Formatter(LOG_FORMAT_ERROR_FILE))
+        logger.addHandler(error_handler)
+    # ハンドラーが受け取らないレベルは呼び出し側で捨てる（ページ・画像ごとの書式化を省く）
+    logger.setLevel(min(handler.level for handler in logger.handlers))
+
+def _init_worker_logging(log_queue: Any, level: int) -> None:
+    """ワーカープロセスのログをキュー経由で親プロセスに送る（ProcessPoolExecutor の initializer）"""
+    logger.handlers[:] = [QueueHandler(log_queue)]
+    logger.setLevel(level)
+    logger.propagate = False
+
+@contextmanager
+def forward_worker_logs() -> Iterator[Dict[str, Any]]:
+    """ワーカープロセスのログを親プロセスで出力するための initializer / initargs を返す"""
+    log_queue = multiprocessing.Queue()
+    listener = QueueListener(log_queue, *(logger.handlers or [logging.lastResort]),
+                             respect_handler_level=True)
+    listener.start()
+    try:
+        yield {'initializer': _init_worker_logging, 'initargs': (log_queue, logger.getEffectiveLevel())}
+    finally:
+        listener.stop()
+        log_queue.close()
+
+class ProgressReporter:
+    """処理済みファイル数・処理速度（files/s）・残り時間の目安を interval 秒ごとに表示"""
+    
+    def __init__(self, total: Optional[int] = None, interval: float = 2.0):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+    
+    def update(self, count: int = 1) -> None:
+        """count 件の処理完了を記録し、必要なら進捗を表示"""
+        self.done += count
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self._report(now)
+    
+    def finish(self) -> None:
+        """最終的な件数と処理速度を表示"""
+        if self.done:
+            self._report(time.perf_counter(), final=True)
+    
+    def _report(self, now: float, final: bool = False) -> None:
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.done / elapsed
+        progress = f"{self.done}/{self.total}" if self.total else f"{self.done}"
+        message = f"⏳ 進捗: {progress} ファイル ({rate:.1f} files/s"
+        if final:
+            message += f", {elapsed:.1f}秒)"
+        elif self.total and rate > 0:
+            remaining = int((self.total - self.done) / rate)
+            message += f", 残り約 {remaining // 60}分{remaining % 60:02d}秒)"
+        else:
+            message += ")"
+        logger.info(message)
+
+def iter_with_progress(items: Iterable[Any], reporter: ProgressReporter) -> Iterator[Any]:
+    """items を順に返しながら、1件ごとに reporter の進捗を進める（最後の表示は reporter.finish()）"""
+    for item in items:
+        reporter.update()
+        yield item
+
 # ===== ファイルクロール機能 =====
-def crawl_files(target_dir: Path, extensions: tuple = ('.docx', '.pdf')) -> List[Path]:
-    """targetディレクトリを再帰的にクロールし、指定された拡張子のファイルを取得"""
+def _matches_any(relative_path: str, patterns: Optional[List[str]]) -> bool:
+    """targetからの相対パス（/区切り）がいずれかのglobパターンに一致するか"""
+    return any(fnmatch.fnmatch(relative_path, pattern) for pattern in patterns or ())
+
+def _scan_directory(directory: str, extensions: Tuple[str, ...], follow_symlinks: bool
+                    ) -> Tuple[List[Dict[str, Any]], List[Tuple[str, Optional[Tuple[int, int]]]]]:
+    """1つのディレクトリを走査し、(対象ファイル情報, (サブディレクトリ, ループ検出用のキー)) を返す"""
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        dir_key = None
+                        if follow_symlinks:
+                            # DirEntry.stat() は Windows では st_dev / st_ino が常に0のため os.stat() で取得
+                            stat = os.stat(entry.path)
+                            dir_key = (stat.st_dev, stat.st_ino)
+                        subdirs.append((entry.path, dir_key))
+                    elif entry.is_file() and entry.name.lower().endswith(extensions):
+                        # サイズ・更新時刻は同じディレクトリエントリから取得
+                        stat = entry.stat()
+                        files.append({'path': entry.path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+                except OSError as e:
+                    logger.warning("警告: %s の情報取得に失敗 - %s", entry.path, e)
+    except OSError as e:
+        logger.warning("警告: ディレクトリ %s の読み込みに失敗 - %s", directory, e)
+    return files, subdirs
+
+def _walk_file_entries(target_dir: Path, on_file: Callable[[Dict[str, Any]], None],
+                       extensions: tuple = ('.docx', '.pdf'), include: Optional[List[str]] = None,
+                       exclude: Optional[List[str]] = None, follow_symlinks: bool = False,
+                       threads: int = 8) -> None:
+    """targetディレクトリを並行して再帰的にクロールし、条件に合うファイル情報を発見順に on_file に渡す"""
     if not target_dir.exists():
         raise FileNotFoundError(f"ディレクトリが見つかりません: {target_dir}")
     
-    files = []
-    for extension in extensions:
-        # 再帰的に検索
-        files.extend(target_dir.rglob(f"*{extension}"))
+    extensions = tuple(extension.lower() for extension in extensions)
+    root = str(target_dir)
+    root_stat = target_dir.stat()
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+    
+    def relative(path: str) -> str:
+        return Path(os.path.relpath(path, root)).as_posix()
+    
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        pending = {executor.submit(_scan_directory, root, extensions, follow_symlinks)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                for file_info in files:
+                    relative_path = relative(file_info['path'])
+                    if include and not _matches_any(relative_path, include):
+                        continue
+                    if _matches_any(relative_path, exclude):
+                        continue
+                    on_file(dict(file_info, path=Path(file_info['path'])))
+                for subdir, dir_key in subdirs:
+                    if dir_key in visited or _matches_any(relative(subdir), exclude):
+                        continue
+                    if dir_key is not None:
+                        visited.add(dir_key)
+                    pending.add(executor.submit(_scan_directory, subdir, extensions, follow_symlinks))
+
+def crawl_file_entries(target_dir: Path, extensions: tuple = ('.docx', '.pdf'),
+                       **crawl_options: Any) -> List[Dict[str, Any]]:
+    """targetディレクトリを再帰的にクロールし、{'path', 'size', 'mtime_ns'} をパス順に取得"""
+    found = []
+    _walk_file_entries(target_dir, found.append, extensions, **crawl_options)
     
     # パス順でソート
-    return sorted(files)
+    found.sort(key=lambda file_info: file_info['path'])
+    return found
+
+def iter_crawl_file_entries(target_dir: Path, extensions: tuple = ('.docx', '.pdf'), max_pending: int = 256,
+                            **crawl_options: Any) -> Iterator[Dict[str, Any]]:
+    """クロールを別スレッドで進め、見つかったファイル情報を発見順に逐次返す（未処理は max_pending 件まで）"""
+    feed: "queue.Queue" = queue.Queue(maxsize=max_pending)
+    stopped = threading.Event()
+    done = object()
+    
+    def put(item: Any) -> None:
+        # 利用側が途中で終了した場合に待機し続けないよう、停止フラグを確認しながら投入
+        while not stopped.is_set():
+            try:
+                feed.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def crawl() -> None:
+        try:
+            _walk_file_entries(target_dir, put, extensions, **crawl_options)
+        except Exception as e:
+            put(e)
+        put(done)
+    
+    crawler = threading.Thread(target=crawl, name="crawler", daemon=True)
+    crawler.start()
+    try:
+        while True:
+            item = feed.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+def crawl_files(target_dir: Path, extensions: tuple = ('.docx', '.pdf'), **crawl_options: Any) -> List[Path]:
+    """targetディレクトリを再帰的にクロールし、指定された拡張子のファイルを取得"""
+    return [file_info['path'] for file_info in crawl_file_entries(target_dir, extensions, **crawl_options)]
+
+# ===== 画像メタデータ取得（ピクセルはデコードしない）=====
+def probe_image_header(image_bytes: bytes) -> Tuple[str, Tuple[int, int], str]:
+    """画像ヘッダーのみを読み、(形式, (幅, 高さ), モード) を返す（ピクセルはデコードしない）"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return image.format or 'Unknown', image.size, image.mode
+
+def _pdf_image_mode(base_image: Dict[str, Any]) -> str:
+    """PyMuPDFの extract_image() が返す色空間情報から、PILでのモードを推定"""
+    cs_name = base_image.get('cs-name', '')
+    if cs_name.startswith('Indexed('):
+        # インデックスカラーはPyMuPDFが基底の色空間に展開して出力する
+        cs_name = cs_name.split(',', 1)[-1]
+    if 'CMYK' in cs_name:
+        return 'CMYK'
+    if 'RGB' in cs_name:
+        return 'RGB'
+    if 'Gray' in cs_name or 'GRAY' in cs_name:
+        return '1' if base_image.get('bpc') == 1 else 'L'
+    return {1: 'L', 3: 'RGB', 4: 'CMYK'}.get(base_image.get('colorspace'), 'Unknown')
+
+# ===== 画像フィルター（抽出・デコード前の絞り込み）=====
+_FORMAT_ALIASES = {'JPG': 'JPEG', 'TIF': 'TIFF', 'JP2': 'JPX', 'JPEG2000': 'JPX'}
+
+def normalize_image_format(image_format: str) -> str:
+    """形式名を 'format' の表記（JPEG, PNG, ...）にそろえる"""
+    image_format = image_format.upper().lstrip('.')
+    return _FORMAT_ALIASES.get(image_format, image_format)
+
+def image_filter_rejects(image_filter: Optional[Dict[str, Any]], image_format: Optional[str] = None,
+                         size: Optional[Tuple[int, int]] = None, byte_size: Optional[int] = None) -> bool:
+    """分かっているメタデータだけで画像を除外するか判定（None の項目は判定に使わない）"""
+    if not image_filter:
+        return False
+    if byte_size is not None and byte_size < image_filter.get('min_bytes', 0):
+        return True
+    formats = image_filter.get('formats')
+    if image_format is not None and formats and normalize_image_format(image_format) not in formats:
+        return True
+    if size is not None:
+        width, height = size
+        if width < image_filter.get('min_width', 0) or height < image_filter.get('min_height', 0):
+            return True
+    return False
+
+def _filter_needs_size(image_filter: Optional[Dict[str, Any]]) -> bool:
+    """幅・高さの条件があるか（ヘッダーを読む必要があるか）"""
+    return bool(image_filter) and bool(image_filter.get('min_width') or image_filter.get('min_height'))
 
 # ===== 画像抽出機能（.docx）=====
-def extract_images_from_docx(docx_path: Path) -> List[Dict[str, Any]]:
-    """.docxファイルから画像を抽出"""
+DOCX_ENGINES = ('python-docx', 'zip')
+
+_IMAGE_REL_TYPE_SUFFIX = '/image'
+_RELS_NAMESPACE = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+def _docx_image_entries(package: ZipFile) -> List[str]:
+    """全パーツのリレーションから、参照されている画像エントリ名を重複なく列挙（本文が先頭）"""
+    names = set(package.namelist())
+    rels_names = sorted(name for name in names
+                        if name.startswith('word/') and '/_rels/' in name and name.endswith('.rels'))
+    main_rels = 'word/_rels/document.xml.rels'
+    if main_rels in rels_names:
+        rels_names.remove(main_rels)
+        rels_names.insert(0, main_rels)
+    
+    entries = []
+    seen = set()
+    for rels_name in rels_names:
+        # word/_rels/header1.xml.rels のターゲットは word/ からの相対パス
+        base_dir = posixpath.dirname(posixpath.dirname(rels_name))
+        root = ElementTree.fromstring(package.read(rels_name))
+        for rel in root.iter(f'{_RELS_NAMESPACE}Relationship'):
+            if not rel.get('Type', '').endswith(_IMAGE_REL_TYPE_SUFFIX) or rel.get('TargetMode') == 'External':
+                continue
+            target = rel.get('Target', '')
+            if target.startswith('/'):
+                entry_name = target.lstrip('/')
+            else:
+                entry_name = posixpath.normpath(posixpath.join(base_dir, target))
+            if entry_name in names and entry_name not in seen:
+                seen.add(entry_name)
+                entries.append(entry_name)
+    return entries
+
+_CONTENT_TYPES_NAMESPACE = '{http://schemas.openxmlformats.org/package/2006/content-types}'
+# フィルター判定時に画像サイズを調べるために読む先頭バイト数
+_HEADER_PROBE_BYTES = 64 * 1024
+
+def _docx_content_type_formats(package: ZipFile) -> Dict[str, str]:
+    """[Content_Types].xml から、パーツ名または拡張子 → 画像形式名 の対応を作成"""
+    formats = {}
+    try:
+        root = ElementTree.fromstring(package.read('[Content_Types].xml'))
+    except (KeyError, ElementTree.ParseError):
+        return formats
+    for element in root:
+        content_type = element.get('ContentType', '')
+        if not content_type.startswith('image/'):
+            continue
+        image_format = normalize_image_format(content_type.split('/', 1)[1].split('+')[0].replace('x-', ''))
+        if element.tag == f'{_CONTENT_TYPES_NAMESPACE}Default':
+            formats['.' + element.get('Extension', '').lower()] = image_format
+        elif element.tag == f'{_CONTENT_TYPES_NAMESPACE}Override':
+            formats[element.get('PartName', '').lstrip('/')] = image_format
+    return formats
+
+def _extract_images_from_docx_zip(docx_path: Path, stream: bool = False,
+                                  thumbnail_options: Optional[Dict[str, Any]] = None,
+                                  image_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """.docxをZIPとして直接読み、全パーツから参照されている画像を抽出"""
+    images = []
+    image_index = 0
+    max_images = (image_filter or {}).get('max_images')
+    with ZipFile(docx_path) as package:
+        content_formats = _docx_content_type_formats(package) if image_filter else {}
+        for entry_name in _docx_image_entries(package):
+            if max_images is not None and len(images) >= max_images:
+                break
+            try:
+                if image_filter:
+                    declared_format = content_formats.get(
+                        entry_name, content_formats.get(posixpath.splitext(entry_name)[1].lower()))
+                    if image_filter_rejects(image_filter, declared_format,
+                                            byte_size=package.getinfo(entry_name).file_size):
+                        continue
+                    if _filter_needs_size(image_filter):
+                        with package.open(entry_name) as member:
+                            header = member.read(_HEADER_PROBE_BYTES)
+                        try:
+                            _, header_size, _ = probe_image_header(header)
+                        except Exception:
+                            header_size = None  # 先頭だけでは判定できない形式は全体を読んでから判定
+                        if image_filter_rejects(image_filter, size=header_size):
+                            continue
+                
+                # 画像データを取得（1件ずつ読み出し、他のエントリは展開しない）
+                image_data = package.read(entry_name)
+                
+                # ヘッダーのみ読んで形式・サイズを取得（デコードはサムネイル作成時のみ）
+                image_format, image_size, image_mode = probe_image_header(image_data)
+                if image_filter_rejects(image_filter, image_format, image_size):
+                    continue
+                
+                images.append(_finalize_image_record({
+                    'file_path': docx_path,
+                    'page_number': 1,  # Wordは単一ページとして扱う
+                    'image_index': image_index,
+                    'data': image_data,
+                    'format': image_format,
+                    'size': image_size,
+                    'mode': image_mode
+                }, stream, thumbnail_options))
+                
+                image_index += 1
+                logger.debug("    画像 %d: %s %s %s", image_index, image_format, image_size, image_mode)
+                
+            except Exception as e:
+                logger.warning("    警告: %s の画像の読み込みに失敗 - %s", docx_path, e)
+                continue
+    
+    return images
+
+def extract_images_from_docx(docx_path: Path, stream: bool = False,
+                             thumbnail_options: Optional[Dict[str, Any]] = None,
+                             engine: str = 'python-docx',
+                             image_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """.docxファイルから画像を抽出（engine='zip' はヘッダー・フッター等も対象、stream=Trueで抽出直後にサムネイル化）"""
     if not docx_path.exists():
         raise FileNotFoundError(f"ファイルが見つかりません: {docx_path}")
+    if engine not in DOCX_ENGINES:
+        raise ValueError(f"未対応の.docx抽出エンジン: {engine}")
+    if engine == 'zip':
+        return _extract_images_from_docx_zip(docx_path, stream, thumbnail_options, image_filter)
     
-    try:
-        images = []
-        doc = Document(docx_path)
-        
-        # 文書内の画像関係を取得
-        image_index = 0
-        for rel in doc.part.rels:
-            relationship = doc.part.rels[rel]
-            if "image" in relationship.target_ref:
-                try:
-                    # 画像データを取得
-                    image_data = relationship.target_part.blob
-                    
-                    # PIL Imageとして読み込み
-                    image = Image.open(io.BytesIO(image_data))
-                    
-                    images.append({
-                        'file_path': docx_path,
-                        'page_number': 1,  # Wordは単一ページとして扱う
-                        'image_index': image_index,
-                        'data': image_data,
-                        'format': image.format or 'Unknown',
-                        'size': image.size,
-                        'mode': image.mode
-                    })
-                    
-                    image_index += 1
-                    print(f"    画像 {image_index}: {image.format} {image.size} {image.mode}")
-                    
-                except Exception as e:
-                    print(f"    警告: 画像の読み込みに失敗 - {e}")
+    images = []
+    doc = Document(docx_path)
+    
+    # 文書内の画像関係を取得
+    image_index = 0
+    max_images = (image_filter or {}).get('max_images')
+    for rel in doc.part.rels:
+        if max_images is not None and len(images) >= max_images:
+            break
+        relationship = doc.part.rels[rel]
+        if "image" in relationship.target_ref:
+            try:
+                # 画像データを取得
+                image_data = relationship.target_part.blob
+                content_type = relationship.target_part.content_type
+                if image_filter_rejects(image_filter, content_type.split('/', 1)[-1].replace('x-', ''),
+                                        byte_size=len(image_data)):
                     continue
-        
-        return images
-        
-    except Exception as e:
-        print(f"エラー: .docxファイルの処理に失敗 - {e}")
-        return []
+                
+                # ヘッダーのみ読んで形式・サイズを取得（デコードはサムネイル作成時のみ）
+                image_format, image_size, image_mode = probe_image_header(image_data)
+                if image_filter_rejects(image_filter, image_format, image_size):
+                    continue
+                
+                images.append(_finalize_image_record({
+                    'file_path': docx_path,
+                    'page_number': 1,  # Wordは単一ページとして扱う
+                    'image_index': image_index,
+                    'data': image_data,
+                    'format': image_format,
+                    'size': image_size,
+                    'mode': image_mode
+                }, stream, thumbnail_options))
+                
+                image_index += 1
+                logger.debug("    画像 %d: %s %s %s", image_index, image_format, image_size, image_mode)
+                
+            except Exception as e:
+                logger.warning("    警告: %s の画像の読み込みに失敗 - %s", docx_path, e)
+                continue
+    
+    return images
 
 # ===== 画像抽出機能（.pdf）- PyMuPDF版 =====
-def extract_images_from_pdf(pdf_path: Path) -> List[Dict[str, Any]]:
-    """.pdfファイルから画像を抽出 (PyMuPDF使用 - 最高性能)"""
+PDF_DEDUP_MODES = ('off', 'share', 'once')
+PDF_THUMBNAIL_ENGINES = ('pil', 'pixmap')
+
+# PDFの画像フィルター名 → 'format' に記録する形式名（extract_image() の ext に合わせる）
+_PDF_FILTER_FORMATS = {'DCTDecode': 'JPEG', 'JPXDecode': 'JPX', 'JBIG2Decode': 'JBIG2',
+                       'CCITTFaxDecode': 'TIFF', 'FlateDecode': 'PNG', '': 'PNG'}
+
+def _pdf_xref_mode(pdf_doc: Any, img: Tuple) -> str:
+    """get_images(full=True) の1要素から色空間のモードを推定（画像ストリームは読まない）"""
+    xref, bpc, cs_name = img[0], img[4], img[5]
+    mode = _pdf_image_mode({'cs-name': cs_name, 'bpc': bpc})
+    if mode != 'Unknown' or cs_name != 'ICCBased':
+        return mode
+    try:
+        kind, value = pdf_doc.xref_get_key(xref, 'ColorSpace')
+        if kind == 'xref':
+            value = pdf_doc.xref_object(int(value.split()[0]), compressed=True)
+        match = re.search(r'/ICCBased\s+(\d+)\s+0\s+R', value)
+        if match:
+            components = pdf_doc.xref_get_key(int(match.group(1)), 'N')[1]
+            mode = {'1': 'L', '3': 'RGB', '4': 'CMYK'}.get(components, mode)
+    except Exception:
+        pass
+    return mode
+
+def _pdf_image_rejected(pdf_doc: Any, img: Tuple, image_filter: Dict[str, Any]) -> bool:
+    """get_images(full=True) の1要素で image_filter を判定（バイト数の条件がある場合のみ /Length を参照）"""
+    image_format = _PDF_FILTER_FORMATS.get(img[8], img[8].replace('Decode', ''))
+    if image_filter_rejects(image_filter, image_format, (img[2], img[3])):
+        return True
+    if image_filter.get('min_bytes'):
+        kind, value = pdf_doc.xref_get_key(img[0], 'Length')
+        if kind == 'xref':
+            value = pdf_doc.xref_object(int(value.split()[0]), compressed=True)
+        if value.strip().isdigit():
+            return image_filter_rejects(image_filter, byte_size=int(value))
+    return False
+
+def _pdf_pixmap_thumbnail(pdf_doc: Any, xref: int, smask: int,
+                          thumbnail_options: Optional[Dict[str, Any]] = None) -> bytes:
+    """fitz.Pixmap でPDF内の画像をデコード・縮小してサムネイルを作成（キャッシュは resize_image_for_excel() と共通）"""
+    options = thumbnail_options or {}
+    target_width, target_height = options.get('target_width', 100), options.get('target_height', 100)
+    variant = _thumbnail_variant(**options) + ":pixmap"
+    raw_stream = pdf_doc.xref_stream_raw(xref) + (pdf_doc.xref_stream_raw(smask) if smask else b'')
+    content_hash = image_content_hash(raw_stream)
+    memo_key = f"{content_hash}:{variant}"
+    if memo_key in _THUMBNAIL_MEMO:
+        _THUMBNAIL_MEMO.move_to_end(memo_key)
+        return _THUMBNAIL_MEMO[memo_key]
+    cache_path = None
+    if options.get('cache_dir') is not None:
+        cache_path = _thumbnail_cache_path(options['cache_dir'], content_hash, variant)
+        cached_thumbnail = load_cached_thumbnail(cache_path)
+        if cached_thumbnail is not None:
+            _remember_thumbnail(memo_key, cached_thumbnail)
+            return cached_thumbnail
+    
+    started = time.perf_counter()
+    pixmap = fitz.Pixmap(pdf_doc, xref)
+    if smask:
+        pixmap = fitz.Pixmap(pixmap, fitz.Pixmap(pdf_doc, smask))
+    if pixmap.colorspace is None or pixmap.colorspace.n not in (1, 3):
+        pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+    # 2のべき乗で縮小（目標サイズを下回らない範囲）
+    shrink = 0
+    while (pixmap.width >> (shrink + 1)) >= target_width and (pixmap.height >> (shrink + 1)) >= target_height:
+        shrink += 1
+    if shrink:
+        pixmap.shrink(shrink)
+    
+    mode = 'L' if pixmap.colorspace.n == 1 else 'RGB'
+    img = Image.frombytes(mode + ('A' if pixmap.alpha else ''), (pixmap.width, pixmap.height), pixmap.samples)
+    if pixmap.alpha:
+        background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img.convert('RGBA')).convert('RGB')
+    thumbnail = _render_thumbnail(img, target_width, target_height, options.get('mode', 'quality'),
+                                  options.get('encoding', 'png'), options.get('jpeg_quality', 85)).getvalue()
+    
+    _THUMBNAIL_TIMER['seconds'] += time.perf_counter() - started
+    _THUMBNAIL_TIMER['count'] += 1
+    _THUMBNAIL_TIMER['output_bytes'] += len(thumbnail)
+    _remember_thumbnail(memo_key, thumbnail)
+    if cache_path is not None:
+        store_cached_thumbnail(cache_path, thumbnail)
+    return thumbnail
+
+def extract_images_from_pdf(pdf_path: Path, stream: bool = False,
+                            thumbnail_options: Optional[Dict[str, Any]] = None,
+                            dedup: str = 'share', page_range: Optional[Tuple[int, int]] = None,
+                            shared_xrefs: frozenset = frozenset(),
+                            thumbnail_engine: str = 'pil',
+                            image_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """.pdfファイルから画像を抽出 (PyMuPDF使用 - 最高性能、stream=Trueで抽出直後にサムネイル化)"""
     if not pdf_path.exists():
         raise FileNotFoundError(f"ファイルが見つかりません: {pdf_path}")
+    if dedup not in PDF_DEDUP_MODES:
+        raise ValueError(f"未対応の重複排除モード: {dedup}")
+    if thumbnail_engine not in PDF_THUMBNAIL_ENGINES:
+        raise ValueError(f"未対応のサムネイル作成方法: {thumbnail_engine}")
     
-    try:
-        images = []
-        image_index = 0
-        
-        # PyMuPDFでPDFを開く
-        pdf_doc = fitz.open(pdf_path)
+    images = []
+    image_index = 0
+    xref_records: Dict[int, Dict[str, Any]] = {}  # xref → 最初に抽出したレコード
+    failed_xrefs = set()
+    rejected_xrefs = set()
+    max_images = (image_filter or {}).get('max_images')
+    placeholder_count = 0  # 仮レコードは結合時に捨てられることがあるため上限に数えない
+    
+    # PyMuPDFでPDFを開く
+    with fitz.open(pdf_path) as pdf_doc:
         
-        # 全ページをループして画像を抽出
-        for page_num in range(len(pdf_doc)):
+        # 全ページ（または指定範囲）をループして画像を抽出
+        for page_num in range(*(page_range or (0, len(pdf_doc)))):
+            if max_images is not None and len(images) - placeholder_count >= max_images:
+                break
             page = pdf_doc[page_num]
-            print(f"    ページ {page_num + 1}/{len(pdf_doc)} を処理中...")
+            logger.debug("    ページ %d/%d を処理中...", page_num + 1, len(pdf_doc))
             
             # ページ内の画像リストを取得
             image_list = page.get_images(full=True)
             
             for img_index, img in enumerate(image_list):
+                # 画像参照情報を取得
+                xref = img[0]  # 画像のxref番号
+                
+                if max_images is not None and len(images) - placeholder_count >= max_images:
+                    break
+                if xref in rejected_xrefs:
+                    continue
+                if image_filter and _pdf_image_rejected(pdf_doc, img, image_filter):
+                    rejected_xrefs.add(xref)
+                    continue
+                
+                if dedup != 'off' and xref in shared_xrefs:
+                    # 前のページ範囲で抽出される画像: 位置だけを記録し、結合時に解決する
+                    images.append({'file_path': pdf_path, 'page_number': page_num + 1,
+                                   'image_index': image_index, 'xref': xref, 'shared_xref': True})
+                    image_index += 1
+                    placeholder_count += 1
+                    continue
+                
+                if dedup != 'off':
+                    if xref in failed_xrefs:
+                        continue
+                    first_record = xref_records.get(xref)
+                    if first_record is not None:
+                        # 抽出済みのxref: デコードせずにページ番号だけ記録
+                        if page_num + 1 not in first_record['pages']:
+                            first_record['pages'].append(page_num + 1)
+                        if dedup == 'once':
+                            continue
+                        images.append(dict(first_record, page_number=page_num + 1, image_index=image_index))
+                        image_index += 1
+                        logger.debug("      画像 %d: xref %d を再利用", image_index, xref)
+                        continue
+                
                 try:
-                    # 画像参照情報を取得
-                    xref = img[0]  # 画像のxref番号
-                    
-                    # 画像データを抽出
-                    base_image = pdf_doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    image_ext = base_image["ext"]
+                    record = None
+                    if thumbnail_engine == 'pixmap':
+                        try:
+                            record = {
+                                'file_path': pdf_path,
+                                'page_number': page_num + 1,
+                                'image_index': image_index,
+                                'thumbnail': _pdf_pixmap_thumbnail(pdf_doc, xref, img[1], thumbnail_options),
+                                'format': _PDF_FILTER_FORMATS.get(img[8], img[8].replace('Decode', '')),
+                                'size': (img[2], img[3]),
+                                'mode': _pdf_xref_mode(pdf_doc, img)
+                            }
+                        except Exception as e:
+                            logger.debug("      Pixmapでのデコードに失敗、元データを抽出 - %s", e)
                     
-                    # PIL Imageとして確認
-                    pil_image = Image.open(io.BytesIO(image_bytes))
-                    
-                    images.append({
-                        'file_path': pdf_path,
-                        'page_number': page_num + 1,
-                        'image_index': image_index,
-                        'data': image_bytes,
-                        'format': image_ext.upper(),
-                        'size': pil_image.size,
-                        'mode': pil_image.mode
-                    })
+                    if record is None:
+                        # 画像データを抽出
+                        base_image = pdf_doc.extract_image(xref)
+                        # PILで開けない形式（JBIG2等）は空のセルになるため、ヘッダーだけ確認して除外する
+                        probe_image_header(base_image["image"])
+                        
+                        # サイズ・色空間はPyMuPDFの情報を使い、PILでのデコードは行わない
+                        record = _finalize_image_record({
+                            'file_path': pdf_path,
+                            'page_number': page_num + 1,
+                            'image_index': image_index,
+                            'data': base_image["image"],
+                            'format': base_image["ext"].upper(),
+                            'size': (base_image["width"], base_image["height"]),
+                            'mode': _pdf_image_mode(base_image)
+                        }, stream, thumbnail_options)
+                    if dedup != 'off':
+                        # 'pages' は同じxrefの全レコードで共有する
+                        record['xref'] = xref
+                        record['pages'] = [page_num + 1]
+                        xref_records[xref] = record
+                    images.append(record)
                     
                     image_index += 1
-                    print(f"      画像 {image_index}: {image_ext.upper()} {pil_image.size} {pil_image.mode}")
+                    logger.debug("      画像 %d: %s %s %s", image_index, record['format'], record['size'], record['mode'])
                     
                 except Exception as e:
-                    print(f"      警告: 画像 {img_index} の抽出に失敗 - {e}")
+                    logger.warning("      警告: %s のページ %d の画像 %d の抽出に失敗 - %s",
+                                   pdf_path, page_num + 1, img_index, e)
+                    failed_xrefs.add(xref)
                     continue
-        
-        pdf_doc.close()
-        return images
-        
+    
+    return images
+
+def plan_pdf_chunks(pdf_path: Path, chunk_pages: int, dedup: str = 'share') -> List[Dict[str, Any]]:
+    """PDFを chunk_pages ページずつに分け、範囲ごとの page_range / shared_xrefs を返す（分割不要なら [{}]）"""
+    try:
+        with fitz.open(pdf_path) as pdf_doc:
+            page_count = len(pdf_doc)
+            if page_count <= chunk_pages:
+                return [{}]
+            page_xrefs = []
+            if dedup != 'off':
+                page_xrefs = [[img[0] for img in pdf_doc[page_num].get_images(full=True)]
+                              for page_num in range(page_count)]
+    except Exception as e:
+        # 開けないファイルはワーカー側で通常どおりエラーとして扱う
+        logger.debug("PDFの分割計画に失敗: %s - %s", pdf_path, e)
+        return [{}]
+    
+    first_pages: Dict[int, int] = {}
+    for page_num, xrefs in enumerate(page_xrefs):
+        for xref in xrefs:
+            first_pages.setdefault(xref, page_num)
+    
+    chunks = []
+    for start in range(0, page_count, chunk_pages):
+        stop = min(start + chunk_pages, page_count)
+        shared_xrefs = frozenset(xref for xrefs in page_xrefs[start:stop] for xref in xrefs
+                                 if first_pages[xref] < start)
+        chunks.append({'page_range': (start, stop), 'shared_xrefs': shared_xrefs})
+    return chunks
+
+def merge_pdf_chunks(chunk_images: List[List[Dict[str, Any]]], dedup: str = 'share',
+                     max_images: Optional[int] = None) -> List[Dict[str, Any]]:
+    """ページ範囲ごとの抽出結果を結合し、分割しない場合と同じ結果にする"""
+    images: List[Dict[str, Any]] = []
+    xref_records: Dict[int, Dict[str, Any]] = {}
+    for chunk in chunk_images:
+        for record in chunk:
+            if max_images is not None and len(images) >= max_images:
+                return images
+            if record.get('shared_xref'):
+                first_record = xref_records.get(record['xref'])
+                if first_record is None:
+                    continue
+                if record['page_number'] not in first_record['pages']:
+                    first_record['pages'].append(record['page_number'])
+                if dedup == 'once':
+                    continue
+                record = dict(first_record, page_number=record['page_number'])
+            elif 'xref' in record:
+                xref_records.setdefault(record['xref'], record)
+            record['image_index'] = len(images)
+            images.append(record)
+    return images
+
+# ===== 画像抽出の振り分け・並列実行 =====
+def _finalize_image_record(image: Dict[str, Any], stream: bool,
+                           thumbnail_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """ストリーミング時は画像をその場でサムネイル化し、元の画像バイトを解放"""
+    if not stream:
+        return image
+    image_data = image.pop('data')
+    resized_image_buffer = resize_image_for_excel(image_data, **(thumbnail_options or {}))
+    image['thumbnail'] = resized_image_buffer.getvalue() if resized_image_buffer else None
+    return image
+
+def extract_images_from_file(file_path: Path, stream: bool = False,
+                             thumbnail_options: Optional[Dict[str, Any]] = None,
+                             docx_options: Optional[Dict[str, Any]] = None,
+                             pdf_options: Optional[Dict[str, Any]] = None,
+                             image_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """拡張子に応じて.docx/.pdfの画像抽出関数を呼び分け"""
+    suffix = file_path.suffix.lower()
+    if suffix == '.docx':
+        return extract_images_from_docx(file_path, stream=stream, thumbnail_options=thumbnail_options,
+                                        image_filter=image_filter, **(docx_options or {}))
+    if suffix == '.pdf':
+        return extract_images_from_pdf(file_path, stream=stream, thumbnail_options=thumbnail_options,
+                                       image_filter=image_filter, **(pdf_options or {}))
+    raise ValueError(f"未対応の形式: {file_path.suffix}")
+
+def _extract_with_metrics(file_path: Path, **extract_options: Any) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """extract_images_from_file() を実行し、ファイル単位の計測値（失敗時は 'error'）と合わせて返す"""
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    thumbnail_start = dict(_THUMBNAIL_TIMER)
+    images, error, file_size = [], None, None
+    try:
+        file_size = file_path.stat().st_size
+        images = extract_images_from_file(file_path, **extract_options)
     except Exception as e:
-        print(f"エラー: .pdfファイルの処理に失敗 - {e}")
-        return []
+        logger.error("エラー: %s の処理に失敗 - %s", file_path, e)
+        error = str(e)
+    wall_seconds = time.perf_counter() - wall_start
+    thumbnail = thumbnail_counters_since(thumbnail_start)
+    metrics = {
+        'path': str(file_path),
+        'bytes': file_size,
+        'images': len(images),
+        'wall_seconds': wall_seconds,
+        'cpu_seconds': time.process_time() - cpu_start,
+        'extract_seconds': wall_seconds - thumbnail['thumbnail_seconds'],
+        **thumbnail,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+    if error is not None:
+        metrics['error'] = error
+    return images, metrics
+
+def _merge_chunk_metrics(chunk_metrics: List[Dict[str, Any]], image_count: int) -> Dict[str, Any]:
+    """ページ範囲ごとの計測値を1ファイル分にまとめる（時間は各範囲の合計、メモリは最大、エラーは最初のもの）"""
+    metrics = dict(chunk_metrics[0], images=image_count, chunks=len(chunk_metrics))
+    errors = [chunk['error'] for chunk in chunk_metrics if 'error' in chunk]
+    if errors:
+        metrics['error'] = errors[0]
+    for field in ('wall_seconds', 'cpu_seconds', 'extract_seconds') + _REPORT_THUMBNAIL_FIELDS:
+        metrics[field] = sum(chunk[field] for chunk in chunk_metrics)
+    metrics['peak_rss_bytes'] = max((chunk['peak_rss_bytes'] for chunk in chunk_metrics
+                                     if chunk['peak_rss_bytes'] is not None), default=None)
+    return metrics
+
+def iter_extracted_images(files: Iterable[Path], workers: int = 1,
+                          file_metrics: Optional[List[Dict[str, Any]]] = None,
+                          pdf_chunk_pages: Optional[int] = None,
+                          executor: Optional[ProcessPoolExecutor] = None,
+                          failures: Optional[Dict[Path, str]] = None,
+                          **extract_options: Any) -> Iterator[Tuple[Path, List[Dict[str, Any]]]]:
+    """ファイルごとに画像を抽出し、(ファイルパス, 画像リスト) を入力順に返す（workers が2以上なら並列）"""
+    extract = partial(_extract_with_metrics, **extract_options)
+    
+    def collect(file_path: Path, images_and_metrics: Tuple[List[Dict[str, Any]], Dict[str, Any]]
+                ) -> List[Dict[str, Any]]:
+        images, metrics = images_and_metrics
+        if file_metrics is not None:
+            file_metrics.append(metrics)
+        if failures is not None and 'error' in metrics:
+            failures[file_path] = metrics['error']
+        return images
+    
+    if workers <= 1 and executor is None:
+        for file_path in files:
+            logger.debug("📄 処理中: %s", file_path.name)
+            yield file_path, collect(file_path, extract(file_path))
+        return
+
+    pdf_options = extract_options.get('pdf_options') or {}
+    pdf_dedup = pdf_options.get('dedup', 'share')
+    
+    def submit(executor: ProcessPoolExecutor, file_path: Path) -> List[Any]:
+        if not pdf_chunk_pages or file_path.suffix.lower() != '.pdf':
+            return [executor.submit(extract, file_path)]
+        chunks = plan_pdf_chunks(file_path, pdf_chunk_pages, pdf_dedup)
+        if len(chunks) > 1:
+            logger.debug("📄 %s を%d個のページ範囲に分割", file_path.name, len(chunks))
+        return [executor.submit(_extract_with_metrics, file_path,
+                                **dict(extract_options, pdf_options=dict(pdf_options, **chunk)))
+                for chunk in chunks]
+    
+    window = max(workers, 1) * 2
+    with ExitStack() as stack:
+        if executor is None:
+            logging_options = stack.enter_context(forward_worker_logs())
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers, **logging_options))
+        pending = deque()
+        # 呼び出し側が途中で反復をやめたら、まだ始まっていない抽出を取り消す
+        stack.callback(lambda: [future.cancel() for _, futures in pending for future in futures])
+        in_flight = 0
+        file_iter = iter(files)
+        for file_path in file_iter:
+            futures = submit(executor, file_path)
+            pending.append((file_path, futures))
+            in_flight += len(futures)
+            if in_flight >= window:
+                break
+        while pending:
+            file_path, futures = pending.popleft()
+            in_flight -= len(futures)
+            try:
+                results = [future.result() for future in futures]
+                if len(results) == 1:
+                    images = collect(file_path, results[0])
+                else:
+                    images = merge_pdf_chunks([chunk_images for chunk_images, _ in results], pdf_dedup,
+                                              (extract_options.get('image_filter') or {}).get('max_images'))
+                    collect(file_path, (images, _merge_chunk_metrics([metrics for _, metrics in results],
+                                                                     len(images))))
+            except Exception as e:
+                logger.error("エラー: %s の処理に失敗 - %s", file_path, e)
+                collect(file_path, ([], {'path': str(file_path), 'images': 0, 'error': str(e)}))
+                images = []
+            while in_flight < window:
+                next_path = next(file_iter, None)
+                if next_path is None:
+                    break
+                futures = submit(executor, next_path)
+                pending.append((next_path, futures))
+                in_flight += len(futures)
+            logger.debug("📄 処理完了: %s", file_path.name)
+            yield file_path, images
+
+# クロール並行モードで行を順に書き出す場合に、クロール完了前に保持しておく抽出結果の最大件数
+OVERLAP_BUFFER_FILES = 256
+
+def overlap_crawl_extraction(entries: Iterator[Dict[str, Any]], select: Callable[[Dict[str, Any]], bool],
+                             extract: Callable[[Iterable[Path]], Iterator[Tuple[Path, List[Dict[str, Any]]]]],
+                             buffer_limit: Optional[int] = None
+                             ) -> Tuple[List[Path], Iterator[Tuple[Path, List[Dict[str, Any]]]]]:
+    """クロールと並行して抽出を始め、(パス順のファイル一覧, パス順の抽出結果) を返す"""
+    files: List[Path] = []
+    selected = set()
+    handed = set()
+    crawl = {'done': False}
+    
+    def note(file_info: Dict[str, Any]) -> bool:
+        files.append(file_info['path'])
+        if select(file_info):
+            selected.add(file_info['path'])
+            return True
+        return False
+    
+    def finish_crawl() -> None:
+        if not crawl['done']:
+            for file_info in entries:
+                note(file_info)
+            files.sort()
+            crawl['done'] = True
+    
+    def feed() -> Iterator[Path]:
+        for file_info in entries:
+            if note(file_info):
+                handed.add(file_info['path'])
+                yield file_info['path']
+        # クロール完了後（受け取りを止めた場合は残りを読み切った後）は未着手のファイルをパス順に渡す
+        finish_crawl()
+        yield from [file_path for file_path in files if file_path in selected and file_path not in handed]
+    
+    buffered: Dict[Path, List[Dict[str, Any]]] = {}
+    extracted = extract(feed())
+    try:
+        for file_path, images in extracted:
+            buffered[file_path] = images
+            if crawl['done'] or (buffer_limit is not None and len(buffered) >= buffer_limit):
+                break
+        finish_crawl()
+    except BaseException:
+        extracted.close()
+        raise
+    
+    def ordered() -> Iterator[Tuple[Path, List[Dict[str, Any]]]]:
+        try:
+            for file_path in files:
+                if file_path not in selected:
+                    continue
+                # クロール中に渡したファイルの結果が先に届くため、それまでの分は順番が来るまで保持する
+                while file_path not in buffered:
+                    extracted_path, images = next(extracted)
+                    buffered[extracted_path] = images
+                yield file_path, buffered.pop(file_path)
+        finally:
+            extracted.close()
+    
+    return files, ordered()
+
+def merge_extracted_rows(files: List[Path], reused: Mapping[Path, List[Dict[str, Any]]],
+                         extracted: Iterator[Tuple[Path, List[Dict[str, Any]]]]
+                         ) -> Iterator[Tuple[Path, List[Dict[str, Any]], bool]]:
+    """再利用する結果と新たに抽出した結果をクロール順に並べ、(パス, 画像リスト, 新たに抽出したか) を返す"""
+    for file_path in files:
+        if file_path in reused:
+            yield file_path, reused[file_path], False
+        else:
+            extracted_path, images = next(extracted)
+            yield extracted_path, images, True
+
+# ===== サムネイルキャッシュ機能 =====
+THUMBNAIL_MODES = ('quality', 'fast')
+THUMBNAIL_ENCODINGS = ('png', 'auto')
+
+def _thumbnail_variant(target_width: int = 100, target_height: int = 100, mode: str = 'quality',
+                       encoding: str = 'png', jpeg_quality: int = 85, **_: Any) -> str:
+    """サムネイルの出力結果に影響する設定を文字列化（キャッシュ・マニフェストの判定用）"""
+    variant = f"{target_width}x{target_height}:{mode}"
+    if encoding != 'png':
+        variant += f":{encoding}-c{_LINE_ART_MAX_COLORS}-q{jpeg_quality}"
+    return variant
+
+def image_content_hash(image_bytes: bytes) -> str:
+    """画像バイトの内容ハッシュ（重複画像の判定キー）"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def _thumbnail_cache_path(cache_dir: Path, content_hash: str, variant: str) -> Path:
+    """元画像の内容ハッシュと出力条件からキャッシュファイルのパスを決定"""
+    key = hashlib.sha256(f"{content_hash}:{variant}".encode('utf-8')).hexdigest()
+    return cache_dir / key[:2] / f"{key}.thumb"
+
+# プロセス内で直近に作成したサムネイル（内容ハッシュ+出力条件 → サムネイル）
+_THUMBNAIL_MEMO: "OrderedDict[str, bytes]" = OrderedDict()
+_THUMBNAIL_MEMO_SIZE = 1024
+
+def _remember_thumbnail(memo_key: str, thumbnail: bytes) -> None:
+    """同一プロセス内の重複画像を再デコードしないようサムネイルを記憶（古い順に破棄）"""
+    _THUMBNAIL_MEMO[memo_key] = thumbnail
+    _THUMBNAIL_MEMO.move_to_end(memo_key)
+    while len(_THUMBNAIL_MEMO) > _THUMBNAIL_MEMO_SIZE:
+        _THUMBNAIL_MEMO.popitem(last=False)
+
+def load_cached_thumbnail(cache_path: Path) -> Optional[bytes]:
+    """キャッシュ済みサムネイルを読み込み、LRU判定用に最終使用時刻を更新"""
+    try:
+        thumbnail = cache_path.read_bytes()
+        os.utime(cache_path)
+        return thumbnail
+    except OSError:
+        # 未キャッシュ、または他プロセスが削除した直後
+        return None
+
+def store_cached_thumbnail(cache_path: Path, thumbnail: bytes) -> None:
+    """サムネイルをキャッシュに保存（一時ファイル経由で置き換え、並列書き込みでも壊れない）"""
+    temp_path = None
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_path.parent, prefix=f"{cache_path.name}.",
+                                         suffix='.tmp', delete=False) as temp_file:
+            temp_path = Path(temp_file.name)
+            temp_file.write(thumbnail)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logger.warning("警告: サムネイルキャッシュの保存に失敗 - %s", e)
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+
+def prune_thumbnail_cache(cache_dir: Path, max_bytes: int) -> int:
+    """キャッシュの合計サイズが上限を超えた分を最終使用が古い順に削除し、削除したファイル数を返す"""
+    if not cache_dir.exists():
+        return 0
+    
+    entries = []
+    total_bytes = 0
+    for cache_path in cache_dir.glob("*/*.thumb"):
+        try:
+            stat = cache_path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, cache_path))
+        total_bytes += stat.st_size
+    
+    removed = 0
+    entries.sort()
+    for _, size, cache_path in entries:
+        if total_bytes <= max_bytes:
+            break
+        try:
+            cache_path.unlink()
+        except OSError:
+            continue
+        total_bytes -= size
+        removed += 1
+    return removed
 
 # ===== 画像リサイズ機能 =====
-def resize_image_for_excel(image_bytes: bytes, target_width: int = 100, target_height: int = 100) -> Optional[io.BytesIO]:
-    """画像をExcel用にリサイズ（バイト→バイト）"""
+# サムネイル作成の累計時間・エンコード時間・出力バイト数（プロセスごと。実行レポートの計測用）
+_THUMBNAIL_TIMER = {'seconds': 0.0, 'count': 0, 'encode_seconds': 0.0, 'output_bytes': 0}
+
+# 縮小後の色数がこれ以下なら図・線画とみなしてパレットPNGにする（パレットの色数と同じにし、減色しない）
+_LINE_ART_MAX_COLORS = 256
+# 縮小・再エンコードせずにそのままExcelへ格納できる形式
+_EXCEL_PASSTHROUGH_FORMATS = ('PNG', 'JPEG', 'GIF')
+
+def thumbnail_counters_since(start: Mapping[str, float]) -> Dict[str, float]:
+    """start（_THUMBNAIL_TIMER の写し）以降のサムネイル作成時間・エンコード時間・出力バイト数"""
+    return {
+        'thumbnail_seconds': _THUMBNAIL_TIMER['seconds'] - start['seconds'],
+        'thumbnail_encode_seconds': _THUMBNAIL_TIMER['encode_seconds'] - start['encode_seconds'],
+        'thumbnail_bytes': _THUMBNAIL_TIMER['output_bytes'] - start['output_bytes'],
+    }
+
+def resize_image_for_excel(image_bytes: bytes, target_width: int = 100, target_height: int = 100,
+                           cache_dir: Optional[Path] = None, mode: str = 'quality',
+                           encoding: str = 'png', jpeg_quality: int = 85) -> Optional[io.BytesIO]:
+    """画像をExcel用にリサイズし、所要時間と出力サイズを _THUMBNAIL_TIMER に加算"""
+    started = time.perf_counter()
+    output_buffer = None
+    try:
+        output_buffer = _resize_image_for_excel(image_bytes, target_width, target_height, cache_dir, mode,
+                                                encoding, jpeg_quality)
+        return output_buffer
+    finally:
+        _THUMBNAIL_TIMER['seconds'] += time.perf_counter() - started
+        _THUMBNAIL_TIMER['count'] += 1
+        if output_buffer is not None:
+            _THUMBNAIL_TIMER['output_bytes'] += output_buffer.getbuffer().nbytes
+
+def _encode_thumbnail(image: Image.Image, encoding: str, jpeg_quality: int) -> io.BytesIO:
+    """縮小済みの画像をエンコード（'auto' は図・線画をパレットPNG、写真などをJPEGにする）"""
+    started = time.perf_counter()
+    output_buffer = io.BytesIO()
+    if encoding == 'auto' and image.getcolors(_LINE_ART_MAX_COLORS) is None:
+        image.save(output_buffer, format='JPEG', quality=jpeg_quality)
+    elif encoding == 'auto':
+        image.quantize(colors=_LINE_ART_MAX_COLORS, dither=Image.Dither.NONE).save(output_buffer, format='PNG')
+    else:
+        image.save(output_buffer, format='PNG')
+    output_buffer.seek(0)
+    _THUMBNAIL_TIMER['encode_seconds'] += time.perf_counter() - started
+    return output_buffer
+
+def _render_thumbnail(img: Image.Image, target_width: int, target_height: int, mode: str,
+                      encoding: str, jpeg_quality: int) -> io.BytesIO:
+    """デコード済みの画像を縮小し、白背景の target_width×target_height に中央寄せしてエンコード"""
+    # RGBAまたはRGB形式に変換
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGB')
+    
+    # アスペクト比を保持してリサイズ
+    if mode == 'fast':
+        # 整数倍の縮小(reduce)で目標サイズ付近まで落としてから補間
+        img.thumbnail((target_width, target_height), Image.Resampling.BILINEAR, reducing_gap=1.0)
+    else:
+        img.thumbnail((target_width, target_height), Image.Resampling.LANCZOS)
+    
+    # 透明な背景で中央に配置（100x100pxの画像を作成）
+    new_img = Image.new('RGB', (target_width, target_height), (255, 255, 255))  # 白背景
+    
+    # 中央に配置
+    x = (target_width - img.width) // 2
+    y = (target_height - img.height) // 2
+    new_img.paste(img, (x, y))
+    
+    # バイトストリームに保存
+    return _encode_thumbnail(new_img, encoding, jpeg_quality)
+
+def _resize_image_for_excel(image_bytes: bytes, target_width: int = 100, target_height: int = 100,
+                            cache_dir: Optional[Path] = None, mode: str = 'quality',
+                            encoding: str = 'png', jpeg_quality: int = 85) -> Optional[io.BytesIO]:
+    """画像をExcel用にリサイズ（バイト→バイト、同じ内容の画像はメモ・キャッシュを再利用）"""
+    variant = _thumbnail_variant(target_width, target_height, mode, encoding, jpeg_quality)
+    content_hash = image_content_hash(image_bytes)
+    memo_key = f"{content_hash}:{variant}"
+    if memo_key in _THUMBNAIL_MEMO:
+        _THUMBNAIL_MEMO.move_to_end(memo_key)
+        return io.BytesIO(_THUMBNAIL_MEMO[memo_key])
+    
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = _thumbnail_cache_path(cache_dir, content_hash, variant)
+        cached_thumbnail = load_cached_thumbnail(cache_path)
+        if cached_thumbnail is not None:
+            _remember_thumbnail(memo_key, cached_thumbnail)
+            return io.BytesIO(cached_thumbnail)
+    
     try:
         # バイトデータからPIL画像を作成
         image_buffer = io.BytesIO(image_bytes)
         with Image.open(image_buffer) as img:
-            # RGBAまたはRGB形式に変換
-            if img.mode not in ('RGB', 'RGBA'):
-                img = img.convert('RGB')
-            
-            # アスペクト比を保持してリサイズ
-            img.thumbnail((target_width, target_height), Image.Resampling.LANCZOS)
+            if (encoding == 'auto' and img.format in _EXCEL_PASSTHROUGH_FORMATS and img.mode != 'CMYK'
+                    and img.width <= target_width and img.height <= target_height):
+                # 小さなアイコン等は再エンコードしない（ヘッダーを読んだだけでデコードしていない）
+                return io.BytesIO(image_bytes)
             
-            # 透明な背景で中央に配置（100x100pxの画像を作成）
-            new_img = Image.new('RGB', (target_width, target_height), (255, 255, 255))  # 白背景
+            if mode == 'fast':
+                # JPEGは目標サイズ以上の範囲で1/2〜1/8に縮小してデコード（他形式では何もしない）
+                img.draft(None, (target_width, target_height))
             
-            # 中央に配置
-            x = (target_width - img.width) // 2
-            y = (target_height - img.height) // 2
-            new_img.paste(img, (x, y))
+            output_buffer = _render_thumbnail(img, target_width, target_height, mode, encoding, jpeg_quality)
             
-            # バイトストリームに保存
-            output_buffer = io.BytesIO()
-            new_img.save(output_buffer, format='PNG')
-            output_buffer.seek(0)
+            _remember_thumbnail(memo_key, output_buffer.getvalue())
+            if cache_path is not None:
+                store_cached_thumbnail(cache_path, output_buffer.getvalue())
             return output_buffer
             
     except Exception as e:
-        print(f"画像リサイズエラー: {e}")
+        logger.warning("画像リサイズエラー: %s", e)
         return None
 
+def _thumbnail_buffer(image_data: Dict[str, Any],
+                      thumbnail_options: Optional[Dict[str, Any]] = None) -> Optional[io.BytesIO]:
+    """画像レコードからExcel挿入用のサムネイルを取得（ストリーミング済みなら再利用）"""
+    if 'thumbnail' in image_data:
+        thumbnail = image_data['thumbnail']
+        return io.BytesIO(thumbnail) if thumbnail else None
+    return resize_image_for_excel(image_data['data'], **(thumbnail_options or {}))
+
 # ===== Excel出力機能 =====
-def export_to_excel(file_list: List[Path], all_images: List[Dict], output_path: Path):
+def _sibling_temp_path(output_path: Path) -> Path:
+    """出力先と同じディレクトリに置く書き込み用の一時ファイル名（プロセス・スレッドごとに一意）"""
+    return output_path.with_name(f"{output_path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+
+@contextmanager
+def atomic_output(output_path: Path) -> Iterator[Path]:
+    """一時ファイルのパスを渡し、ブロックが正常に終わった場合のみ出力先へ置き換える（失敗時は削除）"""
+    temp_path = _sibling_temp_path(output_path)
+    try:
+        yield temp_path
+        os.replace(temp_path, output_path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+_XLSX_MEDIA_PREFIX = 'xl/media/'
+_XLSX_RELS_TARGET_PATTERN = re.compile(r'Target="/?(xl/media/[^"]+)"')
+
+def dedupe_workbook_media(output_path: Path) -> int:
+    """保存済みxlsxの内容が同じメディアパーツを1つにまとめ、.rels の参照先を付け替える（戻り値は削除したパーツ数）"""
+    canonical: Dict[str, str] = {}
+    first_by_hash: Dict[str, str] = {}
+    with ZipFile(output_path) as source:
+        for name in source.namelist():
+            if name.startswith(_XLSX_MEDIA_PREFIX):
+                content_hash = image_content_hash(source.read(name))
+                canonical[name] = first_by_hash.setdefault(content_hash, name)
+    duplicates = {name: target for name, target in canonical.items() if name != target}
+    if not duplicates:
+        return 0
+
+    def retarget(match: re.Match) -> str:
+        return match.group(0).replace(match.group(1), duplicates.get(match.group(1), match.group(1)))
+
+    # 置き換えは読み込み元を閉じてから行う（Windowsでは開いているファイルを置き換えられない）
+    with atomic_output(output_path) as temp_path:
+        with ZipFile(output_path) as source, ZipFile(temp_path, 'w', ZIP_DEFLATED, allowZip64=True) as archive:
+            for info in source.infolist():
+                if info.filename in duplicates:
+                    continue
+                data = source.read(info.filename)
+                if info.filename.endswith('.rels'):
+                    data = _XLSX_RELS_TARGET_PATTERN.sub(retarget, data.decode('utf-8')).encode('utf-8')
+                archive.writestr(info, data)
+    return len(duplicates)
+
+def log_export_completed(output_path: Path) -> None:
+    """出力したExcelのパスとファイルサイズを表示"""
+    file_size = output_path.stat().st_size / 1024  # KB
+    logger.info("✅ Excel出力完了: %s (%.1f KB)", output_path, file_size)
+
+def group_images_by_file(all_images: List[Dict]) -> Dict[Path, List[Dict]]:
+    """画像レコードを抽出元ファイルごとにまとめた索引を作成（1パス・抽出順を維持）"""
+    images_by_file: Dict[Path, List[Dict]] = {}
+    for image_data in all_images:
+        images_by_file.setdefault(image_data.get('file_path'), []).append(image_data)
+    return images_by_file
+
+# 1枚のスプライトの最大幅(px)。JPEGの上限（65535px）を超えないようにする
+_SPRITE_MAX_WIDTH_PX = 65500
+
+def compose_row_sprite(thumbnails: List[Optional[bytes]], cell_size_px: int = 100,
+                       thumbnail_options: Optional[Dict[str, Any]] = None) -> Optional[bytes]:
+    """1行分のサムネイルをセルの位置に合わせて横に並べた1枚の画像（スプライト）を作成"""
+    if np is None:
+        raise RuntimeError("行スプライトの作成には numpy が必要です（pip install numpy）")
+    if not any(thumbnails):
+        return None
+    
+    canvas = np.full((cell_size_px, cell_size_px * len(thumbnails), 3), 255, dtype=np.uint8)
+    for slot, thumbnail in enumerate(thumbnails):
+        if not thumbnail:
+            continue
+        with Image.open(io.BytesIO(thumbnail)) as img:
+            if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+                rgba = np.asarray(img.convert('RGBA'), dtype=np.uint16)
+                alpha = rgba[..., 3:]
+                pixels = ((rgba[..., :3] * alpha + 255 * (255 - alpha) + 127) // 255).astype(np.uint8)
+            else:
+                pixels = np.asarray(img.convert('RGB'))
+        height, width = min(pixels.shape[0], cell_size_px), min(pixels.shape[1], cell_size_px)
+        top = (cell_size_px - height) // 2
+        left = slot * cell_size_px + (cell_size_px - width) // 2
+        canvas[top:top + height, left:left + width] = pixels[:height, :width]
+    
+    options = thumbnail_options or {}
+    return _encode_thumbnail(Image.fromarray(canvas), options.get('encoding', 'png'),
+                             options.get('jpeg_quality', 85)).getvalue()
+
+def compose_row_sprites(thumbnails: List[Optional[bytes]], cell_size_px: int = 100,
+                        thumbnail_options: Optional[Dict[str, Any]] = None) -> List[Tuple[int, bytes]]:
+    """1行分のサムネイルを幅の上限を超えない複数のスプライトにまとめ、(先頭の列位置, 画像) のリストを返す"""
+    per_sprite = max(1, _SPRITE_MAX_WIDTH_PX // cell_size_px)
+    placements: List[Tuple[int, bytes]] = []
+    for start in range(0, len(thumbnails), per_sprite):
+        chunk = thumbnails[start:start + per_sprite]
+        try:
+            sprite = compose_row_sprite(chunk, cell_size_px, thumbnail_options)
+        except Exception as e:
+            logger.warning("行スプライトの作成に失敗、画像を個別に配置 - %s", e)
+            placements.extend((start + offset, thumbnail) for offset, thumbnail in enumerate(chunk) if thumbnail)
+            continue
+        if sprite:
+            placements.append((start, sprite))
+    return placements
+
+def export_to_excel(file_list: List[Path], all_images: Union[List[Dict], Mapping[Path, List[Dict]]],
+                    output_path: Path, thumbnail_options: Optional[Dict[str, Any]] = None,
+                    dedup_media: bool = False, row_sprite: bool = False):
     """ファイルリストと画像をExcelに出力"""
+    if not isinstance(all_images, Mapping):
+        all_images = group_images_by_file(all_images)
+    
     wb = Workbook()
     ws = wb.active
     
@@ -204,103 +1312,1638 @@ def export_to_excel(file_list: List[Path], all_images: List[Dict], output_path:
         ws.row_dimensions[row_idx].height = row_height_pt
         
         # そのファイルに対応する画像を取得
-        file_images = [img for img in all_images if img.get('file_path') == file_path]
+        file_images = all_images.get(file_path, [])
+        
+        # 列幅を設定 (ピクセルをExcel単位に変換)
+        for col_idx in range(2, len(file_images) + 2):  # B列から開始（A列はファイルパス）
+            ws.column_dimensions[get_column_letter(col_idx)].width = cell_size_px / 7  # 約14.3
+        
+        if row_sprite:
+            # 1行分のサムネイルを1枚の画像にまとめてB列に配置（幅の上限を超える行は複数枚に分ける）
+            thumbnails = [_thumbnail_buffer(image_data, thumbnail_options) for image_data in file_images]
+            sprites = compose_row_sprites([buffer.getvalue() if buffer else None for buffer in thumbnails],
+                                          cell_size_px, thumbnail_options)
+            row_images = [(slot + 2, io.BytesIO(sprite)) for slot, sprite in sprites]
+        else:
+            row_images = ((img_idx + 2, _thumbnail_buffer(image_data, thumbnail_options))
+                          for img_idx, image_data in enumerate(file_images))
         
         # 画像を水平方向に配置
-        for img_idx, image_data in enumerate(file_images):
-            col_idx = img_idx + 2  # B列から開始（A列はファイルパス）
+        for col_idx, resized_image_buffer in row_images:
             col_letter = get_column_letter(col_idx)
             
-            # 列幅を設定 (ピクセルをExcel単位に変換)
-            ws.column_dimensions[col_letter].width = cell_size_px / 7  # 約14.3
-            
-            # 画像をリサイズしてExcelに挿入
-            resized_image_buffer = resize_image_for_excel(image_data['data'])
+            # 画像をExcelに挿入
             if resized_image_buffer:
                 try:
+                    # 表示サイズはサムネイルの画素数（通常は100x100px、元画像のまま格納した小さな画像はその大きさ）
                     excel_image = ExcelImage(resized_image_buffer)
-                    excel_image.width = cell_size_px
-                    excel_image.height = cell_size_px
                     
                     # セルに画像を配置
                     ws.add_image(excel_image, f'{col_letter}{row_idx}')
                     
                 except Exception as e:
-                    print(f"Excel画像挿入エラー: {e}")
+                    logger.warning("Excel画像挿入エラー: %s - %s", file_path, e)
     
-    # Excelファイルを保存
-    wb.save(output_path)
+    # Excelファイルを保存（一時ファイルに書き出してから置き換える）
+    with atomic_output(output_path) as temp_path:
+        wb.save(temp_path)
+        if dedup_media:
+            dedupe_workbook_media(temp_path)
     
-    # ファイルサイズを取得
-    file_size = output_path.stat().st_size / 1024  # KB
-    print(f"✅ Excel出力完了: {output_path} ({file_size:.1f} KB)")
+    log_export_completed(output_path)
+
+# ===== ストリーミングExcel出力機能 =====
+_XLSX_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_XLSX_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_EMU_PER_PX = 9525
+
+def _media_extension(data: bytes) -> str:
+    """画像バイトの先頭からxlsx内のメディア拡張子を判定"""
+    if data.startswith(b'\xff\xd8'):
+        return 'jpeg'
+    if data.startswith(b'GIF8'):
+        return 'gif'
+    return 'png'
+
+class StreamingWorkbookWriter:
+    """行を追加するたびにxlsxへ書き出すExcel出力（openpyxlを使わず、メモリ使用量が行数に依存しない）"""
+
+    def __init__(self, output_path: Path, cell_size_px: int = 100, dedup_media: bool = True,
+                 row_sprite: bool = False):
+        self.output_path = output_path
+        self.cell_size_px = cell_size_px
+        self.dedup_media = dedup_media
+        self.row_sprite = row_sprite
+        self.row_count = 0
+        self.image_count = 0
+        self._temp_path = _sibling_temp_path(output_path)
+        self._archive = ZipFile(self._temp_path, 'w', ZIP_DEFLATED, allowZip64=True)
+        self._closed = False
+        self._sheet_rows = tempfile.TemporaryFile()
+        self._anchors = tempfile.TemporaryFile()
+        self._media_ids: Dict[str, int] = {}
+        self._media_names: List[str] = []
+        self._max_images_per_row = 0
+        self._next_row = 1
+        self._write_sheet_row(self._inline_string_cell('A1', 'ファイルパス', style_id=1), row_height=None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._closed:
+            return
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+    @staticmethod
+    def _inline_string_cell(ref: str, text: str, style_id: int = 0) -> str:
+        """インライン文字列のセルXML（共有文字列表を持たずに済む）"""
+        style = f' s="{style_id}"' if style_id else ''
+        return f'<c r="{ref}"{style} t="inlineStr"><is><t>{xml_escape(text)}</t></is></c>'
+
+    def _write_sheet_row(self, cells_xml: str, row_height: Optional[float]) -> None:
+        """1行分のXMLを一時ファイルに追記"""
+        height = f' ht="{row_height}" customHeight="1"' if row_height is not None else ''
+        self._sheet_rows.write(f'<row r="{self._next_row}"{height}>{cells_xml}</row>'.encode('utf-8'))
+        self._next_row += 1
+
+    def _add_media(self, data: bytes) -> int:
+        """画像をメディアパーツとして書き込み、その番号を返す（同じ内容は1つだけ格納）"""
+        media_key = image_content_hash(data) if self.dedup_media else None
+        if media_key is not None and media_key in self._media_ids:
+            return self._media_ids[media_key]
+        
+        media_name = f"image{len(self._media_names) + 1}.{_media_extension(data)}"
+        self._media_names.append(media_name)
+        # 圧縮済みの画像形式を再度deflateしても縮まないため無圧縮で格納
+        self._archive.writestr(f"xl/media/{media_name}", data, compress_type=ZIP_STORED)
+        media_id = len(self._media_names)
+        if media_key is not None:
+            self._media_ids[media_key] = media_id
+        return media_id
+
+    def add_row(self, file_path: Path, images: List[Dict[str, Any]],
+                thumbnail_options: Optional[Dict[str, Any]] = None) -> None:
+        """1ファイル分の行（パスと画像）を書き出す"""
+        thumbnails = []
+        for image_data in images:
+            resized_image_buffer = _thumbnail_buffer(image_data, thumbnail_options)
+            thumbnails.append(resized_image_buffer.getvalue() if resized_image_buffer else None)
+        
+        row_idx = self._next_row
+        row_height_pt = self.cell_size_px / 1.33
+        self._write_sheet_row(self._inline_string_cell(f'A{row_idx}', str(file_path.absolute())),
+                              row_height=row_height_pt)
+        
+        if self.row_sprite:
+            placements = compose_row_sprites(thumbnails, self.cell_size_px, thumbnail_options)
+        else:
+            placements = list(enumerate(thumbnails))
+        
+        for img_idx, thumbnail in placements:
+            if not thumbnail:
+                continue
+            # 表示サイズはサムネイルの画素数（元画像のまま格納した小さな画像は100pxより小さい）
+            _, (width_px, height_px), _ = probe_image_header(thumbnail)
+            media_id = self._add_media(thumbnail)
+            self.image_count += 1
+            # B列から開始（A列はファイルパス）、アンカーの行・列は0始まり
+            self._anchors.write((
+                f'<xdr:oneCellAnchor><xdr:from><xdr:col>{img_idx + 1}</xdr:col><xdr:colOff>0</xdr:colOff>'
+                f'<xdr:row>{row_idx - 1}</xdr:row><xdr:rowOff>0</xdr:rowOff></xdr:from>'
+                f'<xdr:ext cx="{width_px * _EMU_PER_PX}" cy="{height_px * _EMU_PER_PX}"/>'
+                f'<xdr:pic><xdr:nvPicPr><xdr:cNvPr id="{self.image_count + 1}" name="Image {self.image_count}"/>'
+                f'<xdr:cNvPicPr/></xdr:nvPicPr>'
+                f'<xdr:blipFill><a:blip r:embed="rId{media_id}"/><a:stretch><a:fillRect/></a:stretch></xdr:blipFill>'
+                f'<xdr:spPr><a:xfrm/><a:prstGeom prst="rect"/></xdr:spPr></xdr:pic>'
+                f'<xdr:clientData/></xdr:oneCellAnchor>'
+            ).encode('utf-8'))
+        
+        self._max_images_per_row = max(self._max_images_per_row, len(thumbnails))
+        self.row_count += 1
+
+    def _copy_into_archive(self, name: str, head: str, body, tail: str) -> None:
+        """先頭・一時ファイルの内容・末尾をつなげてZIPエントリとして書き込む"""
+        body.seek(0)
+        with self._archive.open(name, 'w', force_zip64=True) as entry:
+            entry.write(head.encode('utf-8'))
+            shutil.copyfileobj(body, entry, 1024 * 1024)
+            entry.write(tail.encode('utf-8'))
+
+    def close(self) -> None:
+        """シート・描画・ブック構成パーツを書き込んでxlsxを完成させる"""
+        try:
+            has_drawing = bool(self._media_names)
+        
+            # シート（列幅はB列以降の使用範囲にまとめて設定）
+            cols = ''
+            if self._max_images_per_row:
+                cols = (f'<cols><col min="2" max="{self._max_images_per_row + 1}" '
+                        f'width="{self.cell_size_px / 7}" customWidth="1"/></cols>')
+            drawing_ref = '<drawing r:id="rId1"/>' if has_drawing else ''
+            self._copy_into_archive(
+                'xl/worksheets/sheet1.xml',
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                f'<worksheet xmlns="{_XLSX_MAIN_NS}" xmlns:r="{_XLSX_REL_NS}">{cols}<sheetData>',
+                self._sheet_rows,
+                f'</sheetData>{drawing_ref}</worksheet>')
+        
+            if has_drawing:
+                self._archive.writestr(
+                    'xl/worksheets/_rels/sheet1.xml.rels',
+                    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{_PKG_REL_NS}">'
+                    f'<Relationship Id="rId1" Type="{_XLSX_REL_NS}/drawing" Target="../drawings/drawing1.xml"/>'
+                    f'</Relationships>')
+                self._copy_into_archive(
+                    'xl/drawings/drawing1.xml',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<xdr:wsDr xmlns:xdr="http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing" '
+                    f'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" xmlns:r="{_XLSX_REL_NS}">',
+                    self._anchors,
+                    '</xdr:wsDr>')
+                with self._archive.open('xl/drawings/_rels/drawing1.xml.rels', 'w') as entry:
+                    entry.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                                f'<Relationships xmlns="{_PKG_REL_NS}">'.encode('utf-8'))
+                    for media_id, media_name in enumerate(self._media_names, start=1):
+                        entry.write(f'<Relationship Id="rId{media_id}" Type="{_XLSX_REL_NS}/image" '
+                                    f'Target="../media/{media_name}"/>'.encode('utf-8'))
+                    entry.write(b'</Relationships>')
+        
+            self._write_package_parts(has_drawing)
+            self._archive.close()
+            os.replace(self._temp_path, self.output_path)
+        except BaseException:
+            self._discard()
+            raise
+        self._sheet_rows.close()
+        self._anchors.close()
+        self._closed = True
+
+    def _write_package_parts(self, has_drawing: bool) -> None:
+        """ブック・スタイル・コンテンツタイプなど固定のパーツを書き込む"""
+        media_defaults = ''.join(
+            f'<Default Extension="{extension}" ContentType="image/{extension}"/>'
+            for extension in sorted({name.rsplit('.', 1)[-1] for name in self._media_names}))
+        drawing_override = (
+            '<Override PartName="/xl/drawings/drawing1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.drawing+xml"/>' if has_drawing else '')
+        self._archive.writestr(
+            '[Content_Types].xml',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'{media_defaults}'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f'{drawing_override}'
+            '</Types>')
+        self._archive.writestr(
+            '_rels/.rels',
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{_PKG_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{_XLSX_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>')
+        self._archive.writestr(
+            'xl/workbook.xml',
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<workbook xmlns="{_XLSX_MAIN_NS}" xmlns:r="{_XLSX_REL_NS}">'
+            '<sheets><sheet name="Sheet" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        self._archive.writestr(
+            'xl/_rels/workbook.xml.rels',
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{_PKG_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{_XLSX_REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+            f'<Relationship Id="rId2" Type="{_XLSX_REL_NS}/styles" Target="styles.xml"/>'
+            '</Relationships>')
+        # スタイル0: 標準、スタイル1: 太字（ヘッダー用）
+        self._archive.writestr(
+            'xl/styles.xml',
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><styleSheet xmlns="{_XLSX_MAIN_NS}">'
+            '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+            '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+            '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+            '<fill><patternFill patternType="gray125"/></fill></fills>'
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+            '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            '</styleSheet>')
+
+    def _discard(self) -> None:
+        """エラー時に書きかけの一時ファイルを閉じて削除（出力先には触れない）"""
+        self._closed = True
+        try:
+            self._archive.close()
+        except Exception:
+            pass
+        self._sheet_rows.close()
+        self._anchors.close()
+        self._temp_path.unlink(missing_ok=True)
+
+# ===== 分割Excel出力機能 =====
+# サムネイル未作成の画像のサイズ見積もり（100×100pxのPNGの目安）
+_ESTIMATED_THUMBNAIL_BYTES = 20 * 1024
+
+def _estimate_row_bytes(images: List[Dict[str, Any]]) -> int:
+    """1行分の画像がExcel内で占めるおおよそのバイト数"""
+    total = 0
+    for image_data in images:
+        thumbnail = image_data.get('thumbnail')
+        total += len(thumbnail) if thumbnail else _ESTIMATED_THUMBNAIL_BYTES
+    return total
+
+def plan_shards(file_list: List[Path], images_by_file: Mapping[Path, List[Dict[str, Any]]],
+                max_rows: Optional[int] = None, max_bytes: Optional[int] = None) -> List[List[Path]]:
+    """行数または推定バイト数の上限で、ファイルリストを複数のブックに分割"""
+    shards: List[List[Path]] = []
+    current: List[Path] = []
+    current_bytes = 0
+    for file_path in file_list:
+        row_bytes = _estimate_row_bytes(images_by_file.get(file_path, []))
+        rows_full = max_rows is not None and len(current) >= max_rows
+        bytes_full = max_bytes is not None and current and current_bytes + row_bytes > max_bytes
+        if rows_full or bytes_full:
+            shards.append(current)
+            current, current_bytes = [], 0
+        current.append(file_path)
+        current_bytes += row_bytes
+    if current:
+        shards.append(current)
+    return shards
+
+def shard_path_for(output_path: Path, shard_number: int) -> Path:
+    """分割ブックのパス（result.xlsx → result_0001.xlsx）"""
+    return output_path.with_name(f"{output_path.stem}_{shard_number:04d}{output_path.suffix}")
+
+def index_path_for(output_path: Path) -> Path:
+    """分割ブックの索引のパス（result.xlsx → result_index.xlsx）"""
+    return output_path.with_name(f"{output_path.stem}_index{output_path.suffix}")
+
+def _write_shard(shard_path: Path, file_list: List[Path], images_by_file: Dict[Path, List[Dict[str, Any]]],
+                 thumbnail_options: Optional[Dict[str, Any]], dedup_media: bool, streaming_writer: bool,
+                 row_sprite: bool = False) -> Path:
+    """1つの分割ブックを書き出す（ワーカープロセスで実行）"""
+    if streaming_writer:
+        with StreamingWorkbookWriter(shard_path, dedup_media=dedup_media, row_sprite=row_sprite) as writer:
+            for file_path in file_list:
+                writer.add_row(file_path, images_by_file.get(file_path, []), thumbnail_options)
+        log_export_completed(shard_path)
+    else:
+        export_to_excel(file_list, images_by_file, shard_path, thumbnail_options, dedup_media=dedup_media,
+                        row_sprite=row_sprite)
+    return shard_path
+
+def _remove_stale_shards(output_path: Path, shard_count: int) -> None:
+    """前回の実行で作られ、今回は使わない番号の分割ブックを削除"""
+    pattern = re.compile(rf"{re.escape(output_path.stem)}_(\d+){re.escape(output_path.suffix)}$")
+    for candidate in output_path.parent.glob(f"{output_path.stem}_*{output_path.suffix}"):
+        match = pattern.match(candidate.name)
+        if match and int(match.group(1)) > shard_count:
+            candidate.unlink()
+
+def export_to_excel_sharded(file_list: List[Path], images_by_file: Mapping[Path, List[Dict[str, Any]]],
+                            output_path: Path, thumbnail_options: Optional[Dict[str, Any]] = None,
+                            dedup_media: bool = True, max_rows: Optional[int] = None,
+                            max_bytes: Optional[int] = None, workers: int = 1,
+                            streaming_writer: bool = False, row_sprite: bool = False) -> List[Path]:
+    """出力を複数のブック（result_0001.xlsx, ...）と索引ブックに分け、並列に書き出す"""
+    shards = plan_shards(file_list, images_by_file, max_rows, max_bytes)
+    shard_paths = [shard_path_for(output_path, number) for number in range(1, len(shards) + 1)]
+    
+    jobs = [
+        (shard_path, shard_files, {file_path: images_by_file.get(file_path, []) for file_path in shard_files})
+        for shard_path, shard_files in zip(shard_paths, shards)
+    ]
+    if workers <= 1 or len(jobs) <= 1:
+        for shard_path, shard_files, shard_images in jobs:
+            _write_shard(shard_path, shard_files, shard_images, thumbnail_options, dedup_media, streaming_writer,
+                         row_sprite)
+    else:
+        with forward_worker_logs() as logging_options, \
+                ProcessPoolExecutor(max_workers=min(workers, len(jobs)), **logging_options) as executor:
+            futures = [
+                executor.submit(_write_shard, shard_path, shard_files, shard_images,
+                                thumbnail_options, dedup_media, streaming_writer, row_sprite)
+                for shard_path, shard_files, shard_images in jobs
+            ]
+            for future in futures:
+                future.result()
+    _remove_stale_shards(output_path, len(shards))
+    
+    # 索引ブック: ファイルパス → 分割ブック名・行番号
+    wb = Workbook()
+    ws = wb.active
+    for col, header in enumerate(('ファイルパス', '出力ファイル', '行番号'), start=1):
+        ws.cell(row=1, column=col, value=header).font = Font(bold=True)
+    row_idx = 2
+    for shard_path, shard_files in zip(shard_paths, shards):
+        for shard_row, file_path in enumerate(shard_files, start=2):
+            ws.cell(row=row_idx, column=1, value=str(file_path.absolute()))
+            ws.cell(row=row_idx, column=2, value=shard_path.name)
+            ws.cell(row=row_idx, column=3, value=shard_row)
+            row_idx += 1
+    index_path = index_path_for(output_path)
+    with atomic_output(index_path) as temp_path:
+        wb.save(temp_path)
+    logger.info("✅ 索引出力完了: %s (%dファイルに分割)", index_path, len(shards))
+    
+    return shard_paths
+
+# ===== 差分実行（マニフェスト）機能 =====
+MANIFEST_VERSION = 1
+
+def manifest_path_for(output_path: Path) -> Path:
+    """出力Excelと同じ場所に置くマニフェストのパス（result.xlsx → result.manifest.json）"""
+    return output_path.with_suffix('.manifest.json')
+
+def _file_sha256(file_path: Path) -> str:
+    """ファイル内容のSHA-256を計算"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _serialize_images(images: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """サムネイル化済みの画像レコードをJSON保存用に変換（file_pathは持たない）"""
+    records = []
+    for image in images:
+        record = {key: value for key, value in image.items() if key not in ('file_path', 'thumbnail')}
+        thumbnail = image.get('thumbnail')
+        record['thumbnail'] = base64.b64encode(thumbnail).decode('ascii') if thumbnail else None
+        records.append(record)
+    return records
+
+def _deserialize_images(file_path: Path, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """JSONから読み込んだ画像レコードを通常の画像レコードに復元"""
+    images = []
+    for record in records:
+        image = dict(record, file_path=file_path)
+        image['size'] = tuple(record['size'])
+        image['thumbnail'] = base64.b64decode(record['thumbnail']) if record['thumbnail'] else None
+        images.append(image)
+    return images
+
+def load_manifest(manifest_path: Path, settings: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """前回実行時のマニフェストを読み込み（存在しない・設定が異なる場合は空）"""
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("警告: マニフェストの読み込みに失敗 - %s", e)
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('settings') != settings:
+        return {}
+    return manifest.get('files', {})
+
+def save_manifest(manifest_path: Path, entries: Dict[str, Dict[str, Any]], settings: Dict[str, Any]) -> None:
+    """マニフェストを保存（一時ファイル経由で置き換え）"""
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'settings': settings,
+        'files': entries,
+    }
+    temp_path = manifest_path.with_name(f"{manifest_path.name}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+def plan_incremental_run(files: List[Path], manifest: Dict[str, Dict[str, Any]], use_hash: bool = False,
+                         file_stats: Optional[Mapping[Path, Tuple[int, int]]] = None
+                         ) -> Tuple[Dict[Path, List[Dict[str, Any]]], List[Path], Dict[str, Dict[str, Any]]]:
+    """マニフェストと現在のファイルを比較し、(再利用する画像, 再抽出するファイル, 再利用分のエントリ) を返す"""
+    reused: Dict[Path, List[Dict[str, Any]]] = {}
+    to_extract: List[Path] = []
+    entries: Dict[str, Dict[str, Any]] = {}
+    
+    for file_path in files:
+        entry = manifest.get(str(file_path))
+        if file_stats is not None and file_path in file_stats:
+            size, mtime_ns = file_stats[file_path]
+        else:
+            stat = file_path.stat()
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        if entry is not None and entry['size'] == size:
+            unchanged = entry['mtime_ns'] == mtime_ns
+            if not unchanged and use_hash and entry.get('sha256'):
+                unchanged = entry['sha256'] == _file_sha256(file_path)
+            if unchanged:
+                entries[str(file_path)] = dict(entry, mtime_ns=mtime_ns)
+                if use_hash and not entry.get('sha256'):
+                    entries[str(file_path)]['sha256'] = _file_sha256(file_path)
+                reused[file_path] = _deserialize_images(file_path, entry['images'])
+                continue
+        to_extract.append(file_path)
+    
+    return reused, to_extract, entries
+
+def make_manifest_entry(file_path: Path, images: List[Dict[str, Any]], use_hash: bool = False,
+                        file_stat: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    """抽出結果からマニフェストのエントリを作成（file_stat は抽出前の (サイズ, 更新時刻ns)）"""
+    if file_stat is None:
+        stat = file_path.stat()
+        file_stat = (stat.st_size, stat.st_mtime_ns)
+    entry = {
+        'size': file_stat[0],
+        'mtime_ns': file_stat[1],
+        'images': _serialize_images(images),
+    }
+    if use_hash:
+        entry['sha256'] = _file_sha256(file_path)
+    return entry
+
+# ===== 中断からの再開（ジャーナル）機能 =====
+JOURNAL_VERSION = 1
+
+def journal_path_for(output_path: Path) -> Path:
+    """出力Excelと同じ場所に置くジャーナルのパス（result.xlsx → result.journal.jsonl）"""
+    return output_path.with_suffix('.journal.jsonl')
+
+def load_journal(journal_path: Path, settings: Dict[str, Any]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """前回の実行が書いたジャーナルを読み込み、完了したファイルの結果を返す（使えない場合は None）"""
+    if not journal_path.exists():
+        return None
+    entries: Dict[str, Dict[str, Any]] = {}
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = {}
+        if header.get('version') != JOURNAL_VERSION or header.get('settings') != settings:
+            logger.warning("警告: ジャーナルの設定が現在の設定と異なるため、最初から処理します")
+            return None
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            path = record.pop('path')
+            if record.pop('error', None) is None:
+                entries[path] = record
+            else:
+                entries.pop(path, None)
+    return entries
+
+class ResultJournal:
+    """ファイルごとの抽出結果（サムネイルを含む）を1行ずつ追記・フラッシュするジャーナル"""
+    
+    def __init__(self, journal_path: Path, settings: Dict[str, Any], append: bool = False,
+                 use_hash: bool = False):
+        self.journal_path = journal_path
+        self.use_hash = use_hash
+        self._file = open(journal_path, 'a' if append else 'w', encoding='utf-8')
+        if not append:
+            self._write({'version': JOURNAL_VERSION, 'settings': settings})
+        elif self._file.tell() > 0 and not self._ends_with_newline():
+            self._file.write('\n')  # 途中で切れた最後の行と次の行がつながらないようにする
+    
+    def _ends_with_newline(self) -> bool:
+        with open(self.journal_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+    
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+    
+    def append(self, file_path: Path, images: List[Dict[str, Any]], error: Optional[str] = None,
+               file_stat: Optional[Tuple[int, int]] = None) -> None:
+        """1ファイル分の結果を追記（ファイル情報を取得できない場合は追記しない）"""
+        if error is not None:
+            self._write({'path': str(file_path), 'error': error})
+            return
+        try:
+            entry = make_manifest_entry(file_path, images, self.use_hash, file_stat)
+        except OSError as e:
+            logger.warning("警告: %s の結果をジャーナルに記録できません - %s", file_path, e)
+            return
+        self._write(dict(entry, path=str(file_path)))
+    
+    def record(self, extracted: Iterable[Tuple[Path, List[Dict[str, Any]]]],
+               failures: Optional[Mapping[Path, str]] = None,
+               file_stats: Optional[Mapping[Path, Tuple[int, int]]] = None
+               ) -> Iterator[Tuple[Path, List[Dict[str, Any]]]]:
+        """iter_extracted_images() の結果を追記しながらそのまま返す"""
+        failures = failures if failures is not None else {}
+        file_stats = file_stats or {}
+        for file_path, images in extracted:
+            self.append(file_path, images, failures.get(file_path), file_stats.get(file_path))
+            yield file_path, images
+    
+    def close(self) -> None:
+        self._file.close()
+    
+    def discard(self) -> None:
+        """出力まで完了したらジャーナルを削除（次回は最初から処理する）"""
+        self.close()
+        self.journal_path.unlink(missing_ok=True)
+
+# ===== 計測・実行レポート機能 =====
+REPORT_VERSION = 2
+_REPORT_FILE_FIELDS = ('path', 'bytes', 'images', 'wall_seconds', 'cpu_seconds', 'extract_seconds',
+                       'thumbnail_seconds', 'thumbnail_encode_seconds', 'thumbnail_bytes', 'peak_rss_bytes', 'error')
+_REPORT_THUMBNAIL_FIELDS = ('thumbnail_seconds', 'thumbnail_encode_seconds', 'thumbnail_bytes')
+
+def peak_rss_bytes() -> Optional[int]:
+    """現在のプロセスのピーク使用メモリ（バイト）を取得（取得できなければ None）"""
+    if resource is not None:
+        # ru_maxrss はmacOSではバイト、Linuxではキロバイト単位
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    if sys.platform != 'win32':
+        return None
+    try:
+        import ctypes
+        from ctypes import wintypes
+        
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+        
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    except (OSError, AttributeError):
+        return None
+
+def stage_snapshot() -> Dict[str, float]:
+    """処理段階の計測開始時点の値を取得（record_stage() に渡す）"""
+    return {'wall': time.perf_counter(), 'cpu': time.process_time(), 'thumbnail': dict(_THUMBNAIL_TIMER)}
+
+def record_stage(stages: Dict[str, Dict[str, Any]], name: str, since: Dict[str, float]) -> None:
+    """stage_snapshot() からの経過を処理段階 name の計測値として stages に記録"""
+    stages[name] = {
+        'wall_seconds': time.perf_counter() - since['wall'],
+        'cpu_seconds': time.process_time() - since['cpu'],
+        **thumbnail_counters_since(since['thumbnail']),
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+def build_run_report(stages: Dict[str, Dict[str, Any]], file_metrics: List[Dict[str, Any]],
+                     top: int = 10) -> Dict[str, Any]:
+    """処理段階・ファイルごとの計測値から実行レポートを作成"""
+    succeeded = [metrics for metrics in file_metrics if 'error' not in metrics]
+    export_stage = stages.get('export', {})
+    thumbnail_totals = {
+        field: sum(metrics[field] for metrics in succeeded) + export_stage.get(field, 0)
+        for field in _REPORT_THUMBNAIL_FIELDS
+    }
+    return {
+        'version': REPORT_VERSION,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'stages': stages,
+        'totals': {
+            'files': len(file_metrics),
+            'failed_files': len(file_metrics) - len(succeeded),
+            'images': sum(metrics['images'] for metrics in succeeded),
+            'bytes_read': sum(metrics['bytes'] for metrics in succeeded),
+            'extract_cpu_seconds': sum(metrics['cpu_seconds'] for metrics in succeeded),
+            'extract_seconds': sum(metrics['extract_seconds'] for metrics in succeeded),
+            **thumbnail_totals,
+            'wall_seconds': sum(stage['wall_seconds'] for stage in stages.values()),
+            'peak_rss_bytes': peak_rss_bytes(),
+            # 抽出を行ったプロセス（並列時はワーカー）のうち最大のピーク使用メモリ
+            'peak_extract_rss_bytes': max((metrics['peak_rss_bytes'] for metrics in succeeded
+                                           if metrics['peak_rss_bytes'] is not None), default=None),
+        },
+        'slowest_files': sorted(succeeded, key=lambda metrics: metrics['wall_seconds'], reverse=True)[:top],
+        'files': file_metrics,
+    }
+
+def write_run_report(report_path: Path, report: Dict[str, Any]) -> None:
+    """実行レポートを保存（拡張子 .csv ならCSV、それ以外はJSON）"""
+    if report_path.suffix.lower() != '.csv':
+        report_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        return
+    
+    with open(report_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=('kind', 'name') + _REPORT_FILE_FIELDS[1:], extrasaction='ignore')
+        writer.writeheader()
+        for name, stage in report['stages'].items():
+            writer.writerow(dict(stage, kind='stage', name=name))
+        for metrics in report['files']:
+            writer.writerow(dict(metrics, kind='file', name=metrics['path']))
+
+# ===== 常駐サービス機能 =====
+# 1リクエストで受け付けるファイル・フォルダの上限（巨大な一覧で待ち行列が埋まらないようにする）
+SERVICE_MAX_PATHS = 10000
+
+def _init_service_worker(*logging_initargs: Any) -> None:
+    """常駐サービスのワーカーの initializer（Ctrl+C は親プロセスだけが受けて停止処理を行う）"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker_logging(*logging_initargs)
+
+def _warm_up_worker() -> int:
+    """ワーカープロセスで各ライブラリを一度使っておく（最初のリクエストの遅延をなくす）"""
+    fitz.open().close()
+    Image.new('RGB', (1, 1)).save(io.BytesIO(), format='PNG')
+    return os.getpid()
+
+def _resolve_service_paths(paths: Any, crawl_options: Dict[str, Any]) -> List[Path]:
+    """リクエストのパス一覧を抽出対象のファイル一覧にする（フォルダは展開、不正なら ValueError）"""
+    if not isinstance(paths, list) or not paths or not all(isinstance(path, str) for path in paths):
+        raise ValueError("'files' にはファイルまたはフォルダのパスの一覧を指定してください")
+    if len(paths) > SERVICE_MAX_PATHS:
+        raise ValueError(f"'files' は{SERVICE_MAX_PATHS}件までです")
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(file_info['path'] for file_info in crawl_file_entries(path, **crawl_options))
+        elif path.is_file() and path.suffix.lower() in ('.docx', '.pdf'):
+            files.append(path)
+        else:
+            raise ValueError(f"未対応または存在しないパス: {path}")
+    return files
+
+def _resolve_service_output(output: Any, output_dir: Path) -> Path:
+    """/workbook の出力先を output_dir 内の実際のパスにする（外を指す場合は ValueError）"""
+    if not isinstance(output, str) or not output:
+        raise ValueError("'output' に出力するExcelのパス（出力フォルダからの相対パス）を指定してください")
+    # Windows・POSIX のどちらの区切り文字で書かれていても同じように判定する
+    relative = PureWindowsPath(output)
+    if relative.anchor or output.startswith('/') or '..' in relative.parts:
+        raise ValueError(f"'output' には出力フォルダからの相対パスを指定してください（'..' は使用不可）: {output}")
+    if relative.suffix.lower() != '.xlsx':
+        raise ValueError(f"'output' の拡張子は .xlsx にしてください: {output}")
+    base = output_dir.resolve()
+    output_path = base.joinpath(*relative.parts)
+    if not output_path.resolve().is_relative_to(base):
+        raise ValueError(f"'output' が出力フォルダの外を指しています: {output}")
+    return output_path
+
+def is_loopback_host(host: str) -> bool:
+    """待ち受けアドレスが同じPCからしか接続できないもの（localhost・127.0.0.0/8・::1）か"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class ExtractionService:
+    """起動済みのプロセスプールで、リクエストごとの文書群から画像を抽出する常駐サービス"""
+    
+    def __init__(self, workers: int, max_batches: int = 2, crawl_options: Optional[Dict[str, Any]] = None,
+                 writer_options: Optional[Dict[str, Any]] = None, output_dir: Optional[Path] = None,
+                 **extract_options: Any):
+        self.workers = workers
+        self.max_batches = max_batches
+        self.output_dir = output_dir or Path.cwd()
+        self.crawl_options = crawl_options or {}
+        self.writer_options = writer_options or {}
+        self.extract_options = dict(extract_options, stream=True)
+        self.active_batches = 0
+        self._slots = threading.BoundedSemaphore(max_batches)
+        self._lock = threading.Lock()
+        self._stack = ExitStack()
+        self._logging_options = self._stack.enter_context(forward_worker_logs())
+        self.executor = self._start_pool()
+    
+    def _start_pool(self) -> ProcessPoolExecutor:
+        """ワーカーを起動し、各ライブラリを読み込ませてから返す"""
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_service_worker,
+                                       initargs=self._logging_options['initargs'])
+        for future in [executor.submit(_warm_up_worker) for _ in range(self.workers)]:
+            future.result()
+        return executor
+    
+    def _replace_broken_pool(self, broken: ProcessPoolExecutor) -> None:
+        """異常終了したプールを作り直す（同時に検出した他のリクエストが作り直し済みなら何もしない）"""
+        with self._lock:
+            if self.executor is not broken:
+                return
+            logger.warning("警告: ワーカーが異常終了したため、プロセスプールを作り直します")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._start_pool()
+    
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        """使用可能なプールを返す（前のリクエストの後に壊れていれば作り直す）"""
+        executor = self.executor
+        try:
+            executor.submit(os.getpid)
+        except BrokenProcessPool:
+            self._replace_broken_pool(executor)
+        return self.executor
+    
+    def close(self) -> None:
+        """未着手の抽出を取り消してワーカーを終了"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self._stack.close()
+    
+    @contextmanager
+    def batch_slot(self) -> Iterator[bool]:
+        """処理枠を1つ確保する（空きがなければ False を返し、待たない）"""
+        acquired = self._slots.acquire(blocking=False)
+        if acquired:
+            with self._lock:
+                self.active_batches += 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with self._lock:
+                    self.active_batches -= 1
+                self._slots.release()
+    
+    def status(self) -> Dict[str, Any]:
+        """稼働状況（ワーカー数と処理中・上限のリクエスト数）"""
+        return {'workers': self.workers, 'active_batches': self.active_batches, 'max_batches': self.max_batches}
+    
+    def extract(self, files: List[Path]) -> Iterator[Tuple[Path, List[Dict[str, Any]]]]:
+        """files を入力順に抽出して (ファイルパス, サムネイル化済みの画像リスト) を返す"""
+        executor = self._ensure_pool()
+        try:
+            yield from iter_extracted_images(files, self.workers, executor=executor, **self.extract_options)
+        except BrokenProcessPool:
+            self._replace_broken_pool(executor)
+            raise
+    
+    def build_workbook(self, files: List[Path], output: str) -> Dict[str, Any]:
+        """files を抽出しながら output_dir 内の output に StreamingWorkbookWriter で書き出す"""
+        output_path = _resolve_service_output(output, self.output_dir)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with StreamingWorkbookWriter(output_path, **self.writer_options) as writer:
+            for file_path, images in self.extract(files):
+                writer.add_row(file_path, images, self.extract_options.get('thumbnail_options'))
+        return {'output': str(output_path), 'files': writer.row_count, 'images': writer.image_count}
+
+class _ServiceRequestHandler(BaseHTTPRequestHandler):
+    """ExtractionService のHTTP API（GET /health、POST /extract、POST /workbook）"""
+    
+    service: ExtractionService  # serve() でサブクラスに設定
+    
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("🌐 %s - %s", self.address_string(), format % args)
+    
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def _read_request(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not isinstance(body, dict):
+            raise ValueError("リクエスト本文はJSONオブジェクトにしてください")
+        return body
+    
+    def do_GET(self) -> None:
+        if self.path != '/health':
+            self._send_json(404, {'error': f"不明なパス: {self.path}"})
+            return
+        self._send_json(200, self.service.status())
+    
+    def do_POST(self) -> None:
+        if self.path not in ('/extract', '/workbook'):
+            self._send_json(404, {'error': f"不明なパス: {self.path}"})
+            return
+        try:
+            body = self._read_request()
+            if self.path == '/workbook':
+                _resolve_service_output(body.get('output'), self.service.output_dir)
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        
+        with self.service.batch_slot() as acquired:
+            if not acquired:
+                self._send_json(503, {'error': "処理中のリクエストが上限に達しています"}, {'Retry-After': '1'})
+                return
+            try:
+                files = _resolve_service_paths(body.get('files'), self.service.crawl_options)
+            except ValueError as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            logger.info("📥 %s: %d ファイル", self.path, len(files))
+            if self.path == '/workbook':
+                try:
+                    result = self.service.build_workbook(files, body['output'])
+                except Exception as e:
+                    logger.error("エラー: Excelの作成に失敗 - %s", e)
+                    self._send_json(500, {'error': str(e)})
+                    return
+                self._send_json(200, result)
+            else:
+                self._stream_extraction(files, body.get('thumbnails', True))
+    
+    def _stream_extraction(self, files: List[Path], thumbnails: bool) -> None:
+        """抽出結果を1ファイルずつNDJSONで書き出す（接続を閉じて終端を示す）"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        image_count = 0
+        extracted = self.service.extract(files)
+        try:
+            for file_path, images in extracted:
+                image_count += len(images)
+                records = _serialize_images(images)
+                if not thumbnails:
+                    for record in records:
+                        record.pop('thumbnail')
+                line = {'path': str(file_path), 'images': records}
+                self.wfile.write(json.dumps(line, ensure_ascii=False).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            done = {'done': True, 'files': len(files), 'images': image_count}
+            self.wfile.write(json.dumps(done).encode('utf-8') + b'\n')
+        except (BrokenPipeError, ConnectionResetError):
+            logger.warning("警告: クライアントが切断したため抽出を中止しました")
+        except BrokenProcessPool as e:
+            # ヘッダーは送信済みのため、エラーの行を返して終端を示す
+            logger.error("エラー: ワーカーの異常終了により抽出を中止しました - %s", e)
+            self.wfile.write(json.dumps({'error': f"ワーカーが異常終了しました: {e}"},
+                                        ensure_ascii=False).encode('utf-8') + b'\n')
+        finally:
+            extracted.close()
+
+def make_server(service: ExtractionService, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+    """ExtractionService のHTTPサーバーを作成（port=0 なら空いているポートを使う。待ち受けは呼び出し側で開始）"""
+    handler = type('ServiceRequestHandler', (_ServiceRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def serve(service: ExtractionService, host: str = '127.0.0.1', port: int = 8765) -> None:
+    """ExtractionService をHTTPで公開し、Ctrl+C（または SIGTERM）で停止するまで待ち受ける"""
+    try:
+        # ポートが使用中などで待ち受けできない場合もワーカーを終了してから例外を返す
+        server = make_server(service, host, port)
+        # サービスとして停止（SIGTERM）された場合も Ctrl+C と同じ停止処理を行う
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        logger.info("🌐 待ち受け中: http://%s:%d （ワーカー %d / 同時リクエスト %d）",
+                    host, server.server_address[1], service.workers, service.max_batches)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("🛑 停止します")
+        finally:
+            server.server_close()
+    finally:
+        service.close()
+
+def request_extraction(url: str, files: List[Union[str, Path]], thumbnails: bool = True,
+                       timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """常駐サービスに抽出を依頼し、ファイルごとの結果を届いた順に返す（ローカル用クライアント）"""
+    body = json.dumps({'files': [str(path) for path in files], 'thumbnails': thumbnails}).encode('utf-8')
+    request = urllib.request.Request(url.rstrip('/') + '/extract', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        for line in response:
+            result = json.loads(line)
+            if result.get('done'):
+                return
+            if 'error' in result:
+                raise RuntimeError(result['error'])
+            file_path = Path(result['path'])
+            records = [dict(record, thumbnail=record.get('thumbnail')) for record in result['images']]
+            yield {'path': file_path, 'images': _deserialize_images(file_path, records)}
+    raise ConnectionError("サービスからの応答が途中で終了しました")
+
+def request_workbook(url: str, files: List[Union[str, Path]], output_path: Union[str, Path],
+                     timeout: Optional[float] = None) -> Dict[str, Any]:
+    """常駐サービスにExcelの作成を依頼し、{'output', 'files', 'images'} を返す（ローカル用クライアント）"""
+    body = json.dumps({'files': [str(path) for path in files], 'output': str(output_path)}).encode('utf-8')
+    request = urllib.request.Request(url.rstrip('/') + '/workbook', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+# ===== 監視モード =====
+# inotify のイベント種別（linux/inotify.h）
+_IN_MODIFY, _IN_ATTRIB, _IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+_IN_MOVED_FROM, _IN_MOVED_TO, _IN_CREATE, _IN_DELETE = 0x40, 0x80, 0x100, 0x200
+_IN_DELETE_SELF, _IN_Q_OVERFLOW, _IN_IGNORED, _IN_ISDIR = 0x400, 0x4000, 0x8000, 0x40000000
+_INOTIFY_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+                 | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF)
+_INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len（この後に len バイトの名前が続く）
+
+class InotifyWatcher:
+    """inotify（Linux）でtarget配下の変更を監視する"""
+    
+    def __init__(self, target_dir: Path):
+        import ctypes
+        import ctypes.util
+        
+        self.target_dir = target_dir
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+        self._watches: Dict[int, str] = {}  # 監視ID → フォルダのパス
+        try:
+            self._add_tree(str(target_dir))
+        except OSError:
+            os.close(self._fd)
+            raise
+    
+    def _add_tree(self, directory: str) -> None:
+        """directory とその配下のフォルダをすべて監視対象にする"""
+        import ctypes
+        
+        for current, _, _ in os.walk(directory):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(current), _INOTIFY_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                # target自体を監視できない場合と監視数の上限（ENOSPC）は inotify を諦める
+                if current == str(self.target_dir) or error == errno.ENOSPC:
+                    raise OSError(error, f"inotify_add_watch に失敗しました: {current}")
+                continue  # 監視前に削除されたフォルダなど
+            self._watches[wd] = current
+    
+    def wait(self, timeout: Optional[float] = None) -> set:
+        """変更があるまで最大 timeout 秒待ち、変更のあったパスを返す（なければ空）"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changes = set()
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changes
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, name_length = _INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += _INOTIFY_EVENT.size
+            name = os.fsdecode(buffer[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+            if mask & _IN_Q_OVERFLOW:
+                changes.add(self.target_dir)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & _IN_IGNORED:
+                del self._watches[wd]
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                self._add_tree(path)
+            changes.add(Path(path))
+        return changes
+    
+    def close(self) -> None:
+        os.close(self._fd)
+
+class PollingWatcher:
+    """一定間隔でtargetをクロールし、前回との差分で変更を検出する（inotify が使えない環境向け）"""
+    
+    def __init__(self, target_dir: Path, interval: float = 5.0, **crawl_options: Any):
+        self.target_dir = target_dir
+        self.interval = interval
+        self.crawl_options = crawl_options
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+    
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        return {file_info['path']: (file_info['size'], file_info['mtime_ns'])
+                for file_info in crawl_file_entries(self.target_dir, **self.crawl_options)}
+    
+    def wait(self, timeout: Optional[float] = None) -> set:
+        """次のクロールまで待ち（最大 timeout 秒）、前回から変わったファイルを返す"""
+        delay = max(self._next_scan - time.monotonic(), 0)
+        if timeout is not None and timeout < delay:
+            time.sleep(timeout)
+            return set()
+        time.sleep(delay)
+        self._next_scan = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changes = {path for path in snapshot.keys() | self._snapshot.keys()
+                   if snapshot.get(path) != self._snapshot.get(path)}
+        self._snapshot = snapshot
+        return changes
+    
+    def close(self) -> None:
+        pass
+
+def open_watcher(target_dir: Path, polling: bool = False, poll_interval: float = 5.0,
+                 **crawl_options: Any) -> Union[InotifyWatcher, PollingWatcher]:
+    """使える場合は InotifyWatcher、それ以外は PollingWatcher を返す"""
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(target_dir)
+        except (OSError, AttributeError) as e:
+            logger.warning("警告: inotify を使えないため定期的なクロールで監視します - %s", e)
+    return PollingWatcher(target_dir, poll_interval, **crawl_options)
+
+def wait_for_changes(watcher: Union[InotifyWatcher, PollingWatcher], debounce: float = 1.0) -> set:
+    """変更があるまで待ち、debounce 秒静かになるまで集めた変更をまとめて返す"""
+    changes = set()
+    while not changes:
+        changes |= watcher.wait()
+    while True:
+        more = watcher.wait(debounce)
+        if not more:
+            return changes
+        changes |= more
+
+def _is_crawl_target(target_dir: Path, path: Path, extensions: tuple = ('.docx', '.pdf'),
+                     include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+                     **_: Any) -> bool:
+    """path がクロール対象か（_walk_file_entries() と同じ拡張子・include / exclude の判定）"""
+    if not path.name.lower().endswith(tuple(extension.lower() for extension in extensions)):
+        return False
+    relative_path = Path(os.path.relpath(path, target_dir)).as_posix()
+    if relative_path.startswith('../'):
+        return False
+    parts = relative_path.split('/')
+    if any(_matches_any('/'.join(parts[:depth]), exclude) for depth in range(1, len(parts))):
+        return False  # 除外されたフォルダの配下
+    if include and not _matches_any(relative_path, include):
+        return False
+    return not _matches_any(relative_path, exclude)
+
+def plan_watch_changes(target_dir: Path, changes: Iterable[Path], entries: Mapping[str, Dict[str, Any]],
+                       crawl_options: Optional[Dict[str, Any]] = None) -> Tuple[List[Path], List[str]]:
+    """変更のあったパスから、(確認が必要なファイル, 結果から除くマニフェストのキー) を求める"""
+    crawl_options = crawl_options or {}
+    candidates = set()
+    removed = set()
+    for path in changes:
+        if path.is_dir():
+            # include / exclude はtargetからの相対パスで判定するため、ここでは絞り込まずにクロール
+            found = crawl_file_entries(path, **dict(crawl_options, include=None, exclude=None))
+            candidates.update(file_info['path'] for file_info in found
+                              if _is_crawl_target(target_dir, file_info['path'], **crawl_options))
+        elif path.is_file():
+            if _is_crawl_target(target_dir, path, **crawl_options):
+                candidates.add(path)
+        # 削除・移動されたファイル、またはフォルダ配下で見つからなくなったファイル
+        prefix = os.path.join(str(path), '')
+        for key in entries:
+            if (key == str(path) or key.startswith(prefix)) and not Path(key).is_file():
+                removed.add(key)
+    return sorted(candidates), sorted(removed)
 
 # ===== メイン処理 =====
-def main():
+def _int_at_least(minimum: int) -> Callable[[str], int]:
+    """minimum 以上の整数だけを受け付ける argparse の type"""
+    def parse(value: str) -> int:
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"整数を指定してください: {value}")
+        if number < minimum:
+            raise argparse.ArgumentTypeError(f"{minimum}以上の整数を指定してください: {value}")
+        return number
+    return parse
+
+def _int_in_range(minimum: int, maximum: int) -> Callable[[str], int]:
+    """minimum 以上 maximum 以下の整数だけを受け付ける argparse の type"""
+    def parse(value: str) -> int:
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"整数を指定してください: {value}")
+        if not minimum <= number <= maximum:
+            raise argparse.ArgumentTypeError(f"{minimum}〜{maximum}の整数を指定してください: {value}")
+        return number
+    return parse
+
+def _positive_float(value: str) -> float:
+    """0より大きい数値だけを受け付ける argparse の type"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"数値を指定してください: {value}")
+    if not 0 < number < float('inf'):
+        raise argparse.ArgumentTypeError(f"0より大きい数値を指定してください: {value}")
+    return number
+
+def _serve_address(value: str) -> Tuple[str, int]:
+    """[HOST:]PORT を (HOST, PORT) に変換する argparse の type（HOST既定: 127.0.0.1）"""
+    host, _, port = value.rpartition(':')
+    try:
+        port_number = int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"[HOST:]PORT の形式で指定してください: {value}")
+    if not 0 <= port_number <= 65535:
+        raise argparse.ArgumentTypeError(f"ポート番号は0〜65535で指定してください: {value}")
+    return host or '127.0.0.1', port_number
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="文書画像抽出システム (PyMuPDF高性能版)")
+    parser.add_argument('--workers', type=_int_at_least(0), default=1,
+                        help="画像抽出の並列プロセス数 (0でCPUコア数、既定: 1=直列)")
+    parser.add_argument('--include', action='append', metavar='PATTERN',
+                        help="対象に含めるファイルのglobパターン（targetからの相対パス、複数指定可）")
+    parser.add_argument('--exclude', action='append', metavar='PATTERN',
+                        help="除外するファイル・フォルダのglobパターン（targetからの相対パス、複数指定可）")
+    parser.add_argument('--follow-symlinks', action='store_true',
+                        help="シンボリックリンク先のフォルダもクロールする（ループは自動で検出）")
+    parser.add_argument('--crawl-threads', type=_int_at_least(1), default=8, metavar='N',
+                        help="フォルダを並行して走査するスレッド数 (既定: 8)")
+    parser.add_argument('--overlap-crawl', action='store_true',
+                        help="クロール完了を待たず、見つかったファイルから順に抽出を始める（行順は出力時にパス順へ戻す）")
+    parser.add_argument('--stream', action='store_true',
+                        help="抽出直後にサムネイル化して元画像を解放し、メモリ使用量を抑える")
+    parser.add_argument('--thumbnail-cache', type=Path, default=None, metavar='DIR',
+                        help="サムネイルのディスクキャッシュを置くディレクトリ（未指定で無効）")
+    parser.add_argument('--thumbnail-cache-max-mb', type=_int_at_least(1), default=1024, metavar='N',
+                        help="サムネイルキャッシュの上限サイズ(MB)。超過分は最終使用が古い順に削除 (既定: 1024)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="result.xlsxの横に保存したマニフェストを使い、新規・変更ファイルのみ再抽出する")
+    parser.add_argument('--manifest-hash', action='store_true',
+                        help="マニフェストにファイル内容のハッシュを記録し、更新時刻のみの変更では再抽出しない")
+    parser.add_argument('--pdf-dedup', choices=PDF_DEDUP_MODES, default='share',
+                        help="PDF内で複数ページに現れる同一画像の扱い: off=毎回抽出 / share=1回だけ抽出して共有 / "
+                             "once=最初の1回のみ出力 (既定: share)")
+    parser.add_argument('--pdf-chunk-pages', type=_int_at_least(1), default=None, metavar='N',
+                        help="Nページを超えるPDFをNページずつに分けて複数プロセスで抽出する（--workers 2以上で有効）")
+    parser.add_argument('--pdf-thumbnail-engine', choices=PDF_THUMBNAIL_ENGINES, default='pil',
+                        help="PDF画像のサムネイル作成方法: pil=元データをPILでデコード / pixmap=PyMuPDFでデコード・"
+                             "ソフトマスク適用・色変換・縮小してからPILに渡す（JBIG2/JPX/CMYKにも対応、高速） (既定: pil)")
+    parser.add_argument('--min-width', type=int, default=None, metavar='PX',
+                        help="幅がこれ未満の画像を抽出しない（スペーサーやアイコンの除外）")
+    parser.add_argument('--min-height', type=int, default=None, metavar='PX',
+                        help="高さがこれ未満の画像を抽出しない")
+    parser.add_argument('--min-bytes', type=int, default=None, metavar='N',
+                        help="データサイズがこれ未満の画像を抽出しない")
+    parser.add_argument('--formats', nargs='+', default=None, metavar='FMT',
+                        help="抽出する画像形式（例: JPEG PNG）。指定した形式以外は抽出しない")
+    parser.add_argument('--max-images-per-doc', type=int, default=None, metavar='N',
+                        help="1文書あたりに抽出する画像の上限")
+    parser.add_argument('--thumbnail-mode', choices=THUMBNAIL_MODES, default='quality',
+                        help="縮小方法: quality=原寸デコード+LANCZOS / fast=JPEGの縮小デコードと段階的縮小で高速化 "
+                             "(既定: quality)")
+    parser.add_argument('--thumbnail-format', choices=THUMBNAIL_ENCODINGS, default='png',
+                        help="サムネイルの形式: png=常にPNG / auto=図・線画はパレットPNG、写真はJPEG、"
+                             "100px以下のPNG/JPEG/GIFは元画像のまま (既定: png)")
+    parser.add_argument('--jpeg-quality', type=_int_in_range(1, 95), default=85, metavar='Q',
+                        help="--thumbnail-format auto で写真をJPEGにするときの品質 1〜95 (既定: 85)")
+    parser.add_argument('--docx-engine', choices=DOCX_ENGINES, default='python-docx',
+                        help="docxの抽出方法: python-docx=本文のみ / zip=ZIPを直接読み、ヘッダー・フッター等も含めて抽出 "
+                             "(既定: python-docx)")
+    parser.add_argument('--streaming-writer', action='store_true',
+                        help="抽出しながらExcelに1行ずつ書き出し、出力時のメモリ使用量を一定に保つ"
+                             "（--streamと併用すると全体のメモリ使用量も一定）")
+    parser.add_argument('--shard-rows', type=_int_at_least(1), default=None, metavar='N',
+                        help="1ブックあたりの最大行数。指定するとresult_0001.xlsx...に分割し、索引をresult_index.xlsxに出力")
+    parser.add_argument('--shard-mb', type=_positive_float, default=None, metavar='MB',
+                        help="1ブックあたりの目標サイズ(MB)。画像サイズの合計がこれを超えないように分割")
+    parser.add_argument('--report', type=Path, default=None, metavar='PATH',
+                        help="処理段階・ファイルごとの計測結果を保存する（.csv ならCSV、それ以外はJSON）")
+    parser.add_argument('--report-top', type=_int_at_least(1), default=10, metavar='N',
+                        help="実行レポートに含める処理時間の長いファイルの件数 (既定: 10)")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument('-q', '--quiet', dest='verbosity', action='store_const', const=-1, default=0,
+                           help="警告・エラーのみ表示する")
+    verbosity.add_argument('-v', '--verbose', dest='verbosity', action='store_const', const=1,
+                           help="ファイル・ページ・画像ごとの詳細を表示する")
+    parser.add_argument('--progress-interval', type=float, default=2.0, metavar='SEC',
+                        help="進捗（処理速度・残り時間）を表示する間隔の秒数 (既定: 2)")
+    parser.add_argument('--error-log', type=Path, default=None, metavar='PATH',
+                        help="読み飛ばした画像・ファイルなどの警告とエラーを記録するログファイル")
+    parser.add_argument('--row-sprite', action='store_true',
+                        help="1行分の画像を横に並べた1枚の画像として配置し、描画オブジェクトを1ファイル1つに減らす（numpyが必要）")
+    parser.add_argument('--journal', action='store_true',
+                        help="ファイルごとの抽出結果を result.journal.jsonl に追記しながら処理する（出力完了後に削除）")
+    parser.add_argument('--resume', action='store_true',
+                        help="前回中断した実行のジャーナルを読み、記録済みのファイルは抽出せずに続きから処理する（--journal を含む）")
+    parser.add_argument('--watch', action='store_true',
+                        help="初回の処理後もtargetを監視し、追加・更新・削除されたファイルだけ再抽出して出力を更新する（--incremental を含む）")
+    parser.add_argument('--watch-debounce', type=float, default=1.0, metavar='SEC',
+                        help="変更が途切れてからSEC秒待ってまとめて更新する (既定: 1.0)")
+    parser.add_argument('--watch-polling', action='store_true',
+                        help="inotify を使わず、定期的なクロールで変更を検出する（ネットワークドライブ向け）")
+    parser.add_argument('--watch-poll-interval', type=_positive_float, default=5.0, metavar='SEC',
+                        help="定期的なクロールで監視する場合の間隔 (既定: 5.0)")
+    parser.add_argument('--serve', type=_serve_address, default=None, metavar='[HOST:]PORT',
+                        help="常駐サービスとして起動し、HTTPで抽出リクエストを受け付ける（HOST既定: 127.0.0.1）")
+    parser.add_argument('--serve-output-dir', type=Path, default=Path('.'), metavar='DIR',
+                        help="常駐サービスの /workbook で作成するExcelの出力先フォルダ。"
+                             "リクエストの 'output' はここからの相対パスに限る (既定: カレントディレクトリ)")
+    parser.add_argument('--serve-allow-remote', action='store_true',
+                        help="常駐サービスを 127.0.0.1 以外のアドレス（0.0.0.0 など）で待ち受けることを許可する")
+    parser.add_argument('--max-batches', type=_int_at_least(1), default=2, metavar='N',
+                        help="常駐サービスで同時に処理するリクエスト数の上限。超えた分は503で断る (既定: 2)")
+    parser.add_argument('--no-image-dedup', action='store_true',
+                        help="同じ画像でもセルごとに別々の画像としてExcelに格納する（既定は1つだけ格納して共有）")
+    parser.add_argument('--compact-media', action='store_true',
+                        help="--streaming-writer を使わない出力でも、保存後にブックを書き直して同じ画像を1つにまとめる"
+                             "（ファイルは小さくなるが保存に時間がかかる）")
+    return parser.parse_args(argv)
+
+def dedup_media_enabled(args: argparse.Namespace) -> bool:
+    """同じ画像をブック内で共有するか（ストリーミング出力は保存時に、openpyxl は --compact-media 指定時のみ）"""
+    return not args.no_image_dedup and (args.streaming_writer or args.compact_media)
+
+def build_image_filter(args: argparse.Namespace) -> Optional[Dict[str, Any]]:
+    """コマンドライン引数から抽出前の絞り込み条件を作成（指定がなければ None）"""
+    image_filter = {}
+    for key, value in (('min_width', args.min_width), ('min_height', args.min_height),
+                       ('min_bytes', args.min_bytes), ('max_images', args.max_images_per_doc)):
+        if value is not None:
+            image_filter[key] = value
+    if args.formats:
+        image_filter['formats'] = frozenset(normalize_image_format(image_format) for image_format in args.formats)
+    return image_filter or None
+
+def export_results(files: List[Path], images_by_file: Mapping[Path, List[Dict[str, Any]]], output_path: Path,
+                   thumbnail_options: Dict[str, Any], args: argparse.Namespace, workers: int) -> Path:
+    """抽出結果を引数に応じた方法でExcelに出力し、出力したファイル（分割時は索引ブック）のパスを返す"""
+    if args.shard_rows is not None or args.shard_mb is not None:
+        max_bytes = int(args.shard_mb * 1024 * 1024) if args.shard_mb is not None else None
+        export_to_excel_sharded(files, images_by_file, output_path, thumbnail_options,
+                                dedup_media=dedup_media_enabled(args), max_rows=args.shard_rows,
+                                max_bytes=max_bytes, workers=workers,
+                                streaming_writer=args.streaming_writer, row_sprite=args.row_sprite)
+        return index_path_for(output_path)
+    if args.streaming_writer:
+        with StreamingWorkbookWriter(output_path, dedup_media=not args.no_image_dedup,
+                                     row_sprite=args.row_sprite) as writer:
+            for file_path in files:
+                writer.add_row(file_path, images_by_file[file_path], thumbnail_options)
+        log_export_completed(output_path)
+        return output_path
+    export_to_excel(files, images_by_file, output_path, thumbnail_options,
+                    dedup_media=dedup_media_enabled(args), row_sprite=args.row_sprite)
+    return output_path
+
+def main(argv: Optional[List[str]] = None):
     """メイン処理関数"""
-    print("🔍 文書画像抽出システム (PyMuPDF高性能版)")
-    print("=" * 50)
+    args = parse_args(argv)
+    configure_logging(args.verbosity, args.error_log)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    sharded = args.shard_rows is not None or args.shard_mb is not None
+    thumbnail_options = {'cache_dir': args.thumbnail_cache, 'mode': args.thumbnail_mode,
+                         'encoding': args.thumbnail_format, 'jpeg_quality': args.jpeg_quality}
+    pdf_options = {'dedup': args.pdf_dedup}
+    if args.pdf_thumbnail_engine != 'pil':
+        # 既定値はマニフェストの設定に含めず、従来のマニフェストをそのまま使えるようにする
+        pdf_options['thumbnail_engine'] = args.pdf_thumbnail_engine
+    docx_options = {'engine': args.docx_engine}
+    image_filter = build_image_filter(args)
+    # 監視モードは差分実行の結果を更新し続ける
+    incremental = args.incremental or args.watch
+    journaling = args.journal or args.resume
+    # 差分実行・ジャーナルではサムネイルを保存するため、常にストリーミングで抽出
+    stream = args.stream or incremental or journaling
+    # 前回の結果（マニフェスト・ジャーナル）を再利用してよいファイルを判定するか
+    reuse_results = incremental or args.resume
+
+    logger.info("🔍 文書画像抽出システム (PyMuPDF高性能版)")
+    logger.info("=" * 50)
+    
+    if args.row_sprite and np is None:
+        logger.error("❌ --row-sprite には numpy が必要です（pip install numpy）")
+        return
+    
+    crawl_options = {'include': args.include, 'exclude': args.exclude,
+                     'follow_symlinks': args.follow_symlinks, 'threads': args.crawl_threads}
+    
+    if args.serve is not None:
+        host, port = args.serve
+        if not is_loopback_host(host) and not args.serve_allow_remote:
+            # 要求されたパスのファイルを読み書きするため、既定では同じPCからの接続に限る
+            logger.error("❌ %s で待ち受けるには --serve-allow-remote を指定してください", host)
+            return
+        if not args.serve_output_dir.is_dir():
+            logger.error("❌ '%s' フォルダが見つかりません（--serve-output-dir）", args.serve_output_dir)
+            return
+        logger.info("⚙️  ワーカーを起動中: %dプロセス", workers)
+        service = ExtractionService(workers, args.max_batches, crawl_options,
+                                    {'dedup_media': not args.no_image_dedup, 'row_sprite': args.row_sprite},
+                                    output_dir=args.serve_output_dir,
+                                    pdf_chunk_pages=args.pdf_chunk_pages, thumbnail_options=thumbnail_options,
+                                    docx_options=docx_options, pdf_options=pdf_options, image_filter=image_filter)
+        try:
+            serve(service, host, port)
+        except OSError as e:
+            logger.error("❌ %s:%d で待ち受けを開始できません - %s", host, port, e)
+        return
     
     target_dir = Path("target")
     
     if not target_dir.exists():
-        print(f"❌ '{target_dir}' ディレクトリが見つかりません")
+        logger.error("❌ '%s' ディレクトリが見つかりません", target_dir)
         return
     
+    output_path = Path("result.xlsx")
+    
     try:
         start_time = time.time()
+        stages = {}
+        file_metrics = []
         
         # ステップ1: ファイルクロール
-        print("📂 ファイルクロール中...")
-        files = crawl_files(target_dir)
-        
-        if not files:
-            print("⚠️  対象ファイルが見つかりませんでした")
-            return
-        
-        print(f"📊 見つかったファイル: {len(files)}個")
-        for file_path in files:
-            print(f"  - {file_path}")
+        if args.overlap_crawl:
+            # クロールは抽出と並行して行うため、ここでは一覧を確定しない
+            logger.info("📂 ファイルクロール中（画像抽出と並行）...")
+        else:
+            logger.info("📂 ファイルクロール中...")
+            snapshot = stage_snapshot()
+            file_entries = crawl_file_entries(target_dir, **crawl_options)
+            files = [file_info['path'] for file_info in file_entries]
+            record_stage(stages, 'crawl', snapshot)
+            
+            if not files and not args.watch:
+                logger.warning("⚠️  対象ファイルが見つかりませんでした")
+                return
+            
+            logger.info("📊 見つかったファイル: %d個", len(files))
+            for file_path in files:
+                logger.debug("  - %s", file_path)
         
         # ステップ2: 画像抽出
-        print()
-        print("🖼️  画像抽出中...")
-        all_images = []
+        logger.info("")
+        logger.info("🖼️  画像抽出中...")
+        if workers > 1:
+            logger.info("⚙️  並列プロセス数: %d", workers)
+        if stream:
+            logger.info("⚙️  ストリーミングモード: 抽出直後にサムネイル化")
+        # クロール並行モードでは 'extract' 段階にクロールの時間も含まれる
+        snapshot = stage_snapshot()
+        # 抽出に失敗したファイルは結果をマニフェスト・ジャーナルに保存せず、次回も抽出し直す
+        failures = {}
+        extract_options = {'file_metrics': file_metrics, 'failures': failures,
+                           'pdf_chunk_pages': args.pdf_chunk_pages,
+                           'stream': stream, 'thumbnail_options': thumbnail_options,
+                           'docx_options': docx_options, 'pdf_options': pdf_options,
+                           'image_filter': image_filter}
+        # クロール時（抽出前）のサイズ・更新時刻。マニフェストにはこちらを記録する
+        file_stats = {}
+        reused = {}
+        manifest_entries = {}
+        manifest = {}
+        journal = None
         
-        for file_path in files:
-            print(f"📄 処理中: {file_path.name}")
+        if incremental or journaling:
+            manifest_settings = {'thumbnail': _thumbnail_variant(**thumbnail_options),
+                                 'pdf': pdf_options, 'docx': docx_options}
+            if image_filter:
+                # 絞り込みなしの場合は従来のマニフェストをそのまま使えるよう設定に含めない
+                manifest_settings['filter'] = {key: sorted(value) if key == 'formats' else value
+                                               for key, value in image_filter.items()}
+        if incremental:
+            manifest_path = manifest_path_for(output_path)
+            manifest = load_manifest(manifest_path, manifest_settings)
+        if journaling:
+            journal_path = journal_path_for(output_path)
+            journal_entries = load_journal(journal_path, manifest_settings) if args.resume else None
+            if journal_entries:
+                logger.info("⏯️  再開: ジャーナルに記録済みのファイル %d件", len(journal_entries))
+                # ジャーナルの方が新しいため、マニフェストより優先する
+                manifest = dict(manifest, **journal_entries)
+            journal = ResultJournal(journal_path, manifest_settings, append=journal_entries is not None,
+                                    use_hash=args.manifest_hash)
+        
+        if args.overlap_crawl:
+            file_entries = []
             
-            if file_path.suffix.lower() == '.docx':
-                images = extract_images_from_docx(file_path)
-            elif file_path.suffix.lower() == '.pdf':
-                images = extract_images_from_pdf(file_path)
-            else:
-                print(f"  ⚠️ 未対応の形式: {file_path.suffix}")
-                continue
+            def select(file_info: Dict[str, Any]) -> bool:
+                # 見つかった順に抽出へ渡す。差分実行ではファイルごとに再利用を判定する
+                file_entries.append(file_info)
+                file_path = file_info['path']
+                file_stats[file_path] = (file_info['size'], file_info['mtime_ns'])
+                if reuse_results:
+                    file_reused, _, file_entry = plan_incremental_run(
+                        [file_path], manifest, args.manifest_hash, file_stats)
+                    if file_reused:
+                        reused.update(file_reused)
+                        manifest_entries.update(file_entry)
+                        return False
+                return True
+            
+            def extract_files(paths: Iterable[Path]) -> Iterator[Tuple[Path, List[Dict[str, Any]]]]:
+                extracted = iter_extracted_images(paths, workers, **extract_options)
+                if journal is not None:
+                    extracted = journal.record(extracted, failures, file_stats)
+                return iter_with_progress(extracted, progress)
+            
+            progress = ProgressReporter(interval=args.progress_interval)
+            # 行を順に書き出す場合のみ、保持する結果の数を抑える（それ以外は全行をメモリに持つため不要）
+            buffer_limit = OVERLAP_BUFFER_FILES if args.streaming_writer and not sharded else None
+            files, extracted = overlap_crawl_extraction(iter_crawl_file_entries(target_dir, **crawl_options),
+                                                        select, extract_files, buffer_limit)
+            
+            if not files and not args.watch:
+                logger.warning("⚠️  対象ファイルが見つかりませんでした")
+                return
             
-            all_images.extend(images)
-            print(f"  📊 抽出数: {len(images)}枚")
+            logger.info("📊 見つかったファイル: %d個", len(files))
+            to_extract = [file_path for file_path in files if file_path not in reused]
+        else:
+            to_extract = files
+            file_stats = {file_info['path']: (file_info['size'], file_info['mtime_ns']) for file_info in file_entries}
+            if reuse_results:
+                reused, to_extract, manifest_entries = plan_incremental_run(files, manifest, args.manifest_hash,
+                                                                            file_stats)
+            progress = ProgressReporter(len(to_extract), args.progress_interval)
+            extracted = iter_extracted_images(to_extract, workers, **extract_options)
+            if journal is not None:
+                extracted = journal.record(extracted, failures, file_stats)
+            extracted = iter_with_progress(extracted, progress)
         
-        # ステップ3: Excel出力
-        print()
-        print("📊 Excel出力中...")
-        output_path = Path("result.xlsx")
-        export_to_excel(files, all_images, output_path)
+        if incremental:
+            removed_count = len(set(manifest) - {str(file_path) for file_path in files})
+            logger.info("♻️  差分実行: 再利用 %d件 / 再抽出 %d件 / 削除 %d件",
+                        len(reused), len(to_extract), removed_count)
+        elif args.resume:
+            logger.info("⏯️  再開: 再利用 %d件 / 抽出 %d件", len(reused), len(to_extract))
+        
+        # ストリーミング出力では抽出と並行して行を書き出し、結果はメモリに残さない
+        with ExitStack() as writer_stack:
+            writer = None
+            if args.streaming_writer and not sharded:
+                logger.info("⚙️  ストリーミング出力: 抽出しながらExcelに書き込み")
+                writer = writer_stack.enter_context(StreamingWorkbookWriter(
+                    output_path, dedup_media=not args.no_image_dedup, row_sprite=args.row_sprite))
+            images_by_file = {}
+            image_count = 0
+        
+            for file_path, images, is_new in merge_extracted_rows(files, reused, extracted):
+                image_count += len(images)
+                if is_new:
+                    logger.debug("  📊 %s の抽出数: %d枚", file_path.name, len(images))
+                    if incremental and file_path not in failures:
+                        try:
+                            manifest_entries[str(file_path)] = make_manifest_entry(
+                                file_path, images, args.manifest_hash, file_stats.get(file_path))
+                        except OSError as e:
+                            # 処理中に削除されたファイルは記録せず、次回改めて確認する
+                            logger.warning("警告: %s をマニフェストに記録できません - %s", file_path, e)
+                if writer is not None:
+                    writer.add_row(file_path, images, thumbnail_options)
+                else:
+                    images_by_file[file_path] = images
+        
+            progress.finish()
+        
+            if incremental:
+                save_manifest(manifest_path, manifest_entries, manifest_settings)
+            record_stage(stages, 'extract', snapshot)
+        
+            # ステップ3: Excel出力
+            logger.info("")
+            logger.info("📊 Excel出力中...")
+            snapshot = stage_snapshot()
+            if writer is not None:
+                writer.close()
+                log_export_completed(output_path)
+                written_path = output_path
+            else:
+                written_path = export_results(files, images_by_file, output_path, thumbnail_options, args, workers)
+        
+        if journal is not None:
+            # 出力まで完了したため、再開用のジャーナルは不要
+            journal.discard()
+        record_stage(stages, 'export', snapshot)
+        
+        if args.thumbnail_cache is not None:
+            removed = prune_thumbnail_cache(args.thumbnail_cache, args.thumbnail_cache_max_mb * 1024 * 1024)
+            if removed:
+                logger.info("🧹 サムネイルキャッシュ: 古いエントリを%d件削除", removed)
         
         # 結果表示
         end_time = time.time()
         processing_time = end_time - start_time
         
-        print()
-        print("🎉 処理完了！")
-        print(f"📈 処理結果:")
-        print(f"  - 処理ファイル数: {len(files)}個")
-        print(f"  - 抽出画像総数: {len(all_images)}枚")
-        print(f"  - 処理時間: {processing_time:.2f}秒")
-        print(f"  - 出力ファイル: {output_path}")
+        logger.info("")
+        logger.info("🎉 処理完了！")
+        logger.info("📈 処理結果:")
+        logger.info("  - 処理ファイル数: %d個", len(files))
+        logger.info("  - 抽出画像総数: %d枚", image_count)
+        logger.info("  - 処理時間: %.2f秒", processing_time)
+        logger.info("  - 出力ファイル: %s", written_path)
+        
+        if args.report is not None:
+            report = build_run_report(stages, file_metrics, args.report_top)
+            write_run_report(args.report, report)
+            logger.info("⏱️  処理段階別: %s", " / ".join(f"{name} {stage['wall_seconds']:.2f}秒"
+                                                        for name, stage in stages.items()))
+            logger.info("📝 実行レポート: %s", args.report)
+        
+        # ステップ4: 監視（変更のあったファイルだけ再抽出し、マニフェストの結果から出力を作り直す）
+        if args.watch:
+            watcher = open_watcher(target_dir, args.watch_polling, args.watch_poll_interval, **crawl_options)
+            method = "inotify" if isinstance(watcher, InotifyWatcher) else f"{args.watch_poll_interval}秒ごとのクロール"
+            logger.info("")
+            logger.info("👀 %s を監視中（%s）... Ctrl+Cで終了", target_dir, method)
+            # 抽出に失敗したファイルはマニフェストに入れず、空の行として出力に残す
+            failed_files = set(failures)
+            # 更新が途中で失敗した場合に、次の変更時にやり直す抽出・出力
+            retry_paths = set()
+            export_pending = False
+            try:
+                while True:
+                    changes = wait_for_changes(watcher, args.watch_debounce)
+                    try:
+                        refresh_start = time.time()
+                        # 前回の更新が途中で失敗したファイルも改めて確認する
+                        candidates, removed = plan_watch_changes(target_dir, changes | retry_paths, manifest_entries,
+                                                                 crawl_options)
+                        _, to_extract, kept_entries = plan_incremental_run(candidates, manifest_entries, args.manifest_hash)
+                        vanished = {file_path for file_path in failed_files if not file_path.is_file()}
+                        if not to_extract and not removed and not vanished and not export_pending:
+                            continue
+                        export_pending = True
+                        failed_files -= vanished
+                        for key in removed:
+                            del manifest_entries[key]
+                            failed_files.discard(Path(key))
+                        manifest_entries.update(kept_entries)
+                        # 抽出中に更新されたファイルを取りこぼさないよう、サイズ・更新時刻は抽出前に取得
+                        watch_stats = {}
+                        for file_path in to_extract:
+                            try:
+                                stat = file_path.stat()
+                            except OSError:
+                                continue  # 直後に削除されたファイルは抽出の失敗として扱われる
+                            watch_stats[file_path] = (stat.st_size, stat.st_mtime_ns)
+                        retry_paths = set(to_extract)
+                        watch_failures = {}
+                        for file_path, images in iter_extracted_images(
+                                to_extract, workers, **dict(extract_options, file_metrics=None, failures=watch_failures)):
+                            if file_path in watch_failures:
+                                manifest_entries.pop(str(file_path), None)
+                                failed_files.add(file_path)
+                            else:
+                                manifest_entries[str(file_path)] = make_manifest_entry(
+                                    file_path, images, args.manifest_hash, watch_stats.get(file_path))
+                                failed_files.discard(file_path)
+                            retry_paths.discard(file_path)
+                        save_manifest(manifest_path, manifest_entries, manifest_settings)
+                    
+                        files = sorted({Path(key) for key in manifest_entries} | failed_files)
+                        images_by_file = {file_path: _deserialize_images(file_path, manifest_entries[str(file_path)]['images'])
+                                          if str(file_path) in manifest_entries else []
+                                          for file_path in files}
+                        written_path = export_results(files, images_by_file, output_path, thumbnail_options, args, workers)
+                        export_pending = False
+                        logger.info("🔄 更新: 再抽出 %d件 / 削除 %d件 → %s (%.2f秒)",
+                                    len(to_extract), len(removed), written_path, time.time() - refresh_start)
+                    except Exception as e:
+                        # 出力ファイルが開かれている・処理中に削除されたなどの一時的な失敗では監視を止めない
+                        logger.error("❌ 更新に失敗しました（次の変更時に再試行します）: %s", e)
+            except KeyboardInterrupt:
+                logger.info("🛑 監視を終了します")
+            finally:
+                watcher.close()
         
     except Exception as e:
-        print(f"❌ エラーが発生しました: {e}")
+        logger.error("❌ エラーが発生しました: %s", e)
         sys.exit(1)
 
 if __name__ == "__main__":
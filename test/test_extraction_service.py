@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常駐サービス（ExtractionService）のテスト
+空きポートで起動したHTTPサーバーに request_extraction / request_workbook で接続し、
+/extract のストリーミング、処理枠が埋まっているときの503、/workbook の出力を確認する
+"""
+
+from pathlib import Path
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import openpyxl
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from main import (  # noqa: E402
+    ExtractionService, make_server, request_extraction, request_workbook,
+    crawl_file_entries, extract_images_from_file,
+)
+
+SAMPLES_DIR = Path(__file__).resolve().parent.parent / "target" / "samples"
+
+@pytest.fixture(scope="module")
+def service_url(tmp_path_factory):
+    """ワーカー1つ・同時リクエスト1件のサービスを port=0 で起動し、(URL, サービス) を返す"""
+    output_dir = tmp_path_factory.mktemp("service_output")
+    service = ExtractionService(1, max_batches=1, output_dir=output_dir)
+    server = make_server(service, '127.0.0.1', 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", service
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+def expected_files():
+    """サービスがフォルダを展開したときと同じ順のファイル一覧"""
+    return [file_info['path'] for file_info in crawl_file_entries(SAMPLES_DIR)]
+
+def wait_until_idle(service, timeout=10.0):
+    """前のリクエストの処理枠が解放されるまで待つ（応答の送信後に解放されるため）"""
+    deadline = time.monotonic() + timeout
+    while service.status()['active_batches'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_extract_streams_each_file_in_order(service_url):
+    url, _ = service_url
+    results = list(request_extraction(url, [SAMPLES_DIR]))
+
+    assert [result['path'] for result in results] == expected_files()
+    for result in results:
+        assert len(result['images']) == len(extract_images_from_file(result['path']))
+        for image in result['images']:
+            assert image['file_path'] == result['path']
+            assert image['thumbnail'] is None or image['thumbnail'].startswith(b'\x89PNG')
+
+def test_extract_without_thumbnails(service_url):
+    url, _ = service_url
+    results = list(request_extraction(url, [SAMPLES_DIR], thumbnails=False))
+
+    assert results
+    assert all(image['thumbnail'] is None for result in results for image in result['images'])
+
+def test_busy_service_returns_503(service_url):
+    url, service = service_url
+    wait_until_idle(service)
+    with service.batch_slot() as acquired:
+        assert acquired
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            list(request_extraction(url, [SAMPLES_DIR]))
+        assert excinfo.value.code == 503
+        assert excinfo.value.headers['Retry-After'] == '1'
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            request_workbook(url, [SAMPLES_DIR], "busy.xlsx")
+        assert excinfo.value.code == 503
+    assert not (service.output_dir / "busy.xlsx").exists()
+
+    # 処理枠が空けば再び受け付ける
+    assert list(request_extraction(url, [SAMPLES_DIR]))
+
+def test_health_reports_status(service_url):
+    url, service = service_url
+    wait_until_idle(service)
+    with urllib.request.urlopen(url + "/health") as response:
+        status = json.loads(response.read())
+    assert status == {'workers': 1, 'active_batches': 0, 'max_batches': 1}
+
+def test_workbook_is_written_inside_output_dir(service_url):
+    url, service = service_url
+    wait_until_idle(service)
+    result = request_workbook(url, [SAMPLES_DIR], "reports/result.xlsx")
+
+    output_path = service.output_dir / "reports" / "result.xlsx"
+    assert Path(result['output']) == output_path.resolve()
+    assert result['files'] == len(expected_files())
+    sheet = openpyxl.load_workbook(output_path).active
+    assert [cell.value for cell in sheet['A']][1:] == [str(path.absolute()) for path in expected_files()]
+
+@pytest.mark.parametrize("output", ["/tmp/escape.xlsx", "../escape.xlsx", "reports/../../escape.xlsx",
+                                    "C:\\escape.xlsx", "result.txt"])
+def test_workbook_rejects_output_outside_output_dir(service_url, output):
+    url, _ = service_url
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        request_workbook(url, [SAMPLES_DIR], output)
+    assert excinfo.value.code == 400
+
+def test_unknown_paths_are_rejected(service_url):
+    url, service = service_url
+    wait_until_idle(service)
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        list(request_extraction(url, [SAMPLES_DIR / "missing.pdf"]))
+    assert excinfo.value.code == 400